@@ -0,0 +1,156 @@
+# buffer_disco.py
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger("logger_financa")
+
+# Memória máxima ocupada pelos DataFrames guardados no buffer; o excedente vai para disco.
+# O orçamento vale para o processo inteiro (ver `buffer_compartilhado`).
+LIMITE_MEMORIA_BUFFER_MB = int(os.environ.get("LIMITE_MEMORIA_BUFFER_MB", "512"))
+
+
+class BufferDisco:
+    """
+    Guarda DataFrames intermediários (ex.: o extrato entre as etapas) dentro de um orçamento de memória.
+    O que exceder o limite é gravado em arquivos Arrow IPC numa pasta temporária e relido sob
+    demanda via memory-map, mantendo o processo dentro de um teto fixo de memória.
+    Fatias (views) de um DataFrame que continua vivo são guardadas com `referencia=True`: não
+    contam no orçamento nem vão para disco, pois descarregá-las não liberaria memória alguma.
+    """
+
+    def __init__(self, limite_memoria_mb: int = LIMITE_MEMORIA_BUFFER_MB, pasta: Optional[str] = None):
+        self.limite_bytes = limite_memoria_mb * 1024 * 1024
+        self._pasta_base = pasta
+        self._pasta: Optional[str] = None
+        self._memoria: Dict[str, pd.DataFrame] = {}
+        self._tamanhos: Dict[str, int] = {}
+        self._em_disco: Dict[str, str] = {}
+        self._arquivos_criados = 0
+        self._lock = threading.RLock()
+        self.bytes_em_memoria = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.fechar()
+
+    def __len__(self) -> int:
+        return len(self._memoria) + len(self._em_disco)
+
+    def __contains__(self, chave: str) -> bool:
+        return chave in self._memoria or chave in self._em_disco
+
+    def chaves(self, prefixo: str = "") -> List[str]:
+        """Chaves guardadas, opcionalmente só as que começam com `prefixo`."""
+        with self._lock:
+            return [chave for chave in list(self._memoria) + list(self._em_disco) if chave.startswith(prefixo)]
+
+    def _novo_caminho(self) -> str:
+        if self._pasta is None:
+            self._pasta = tempfile.mkdtemp(prefix="buffer_fato_", dir=self._pasta_base)
+        self._arquivos_criados += 1
+        return os.path.join(self._pasta, f"{self._arquivos_criados:06d}.arrow")
+
+    def guardar(self, chave: str, df: pd.DataFrame, referencia: bool = False):
+        """
+        Guarda o DataFrame em memória se couber no orçamento; caso contrário, grava em disco.
+        Com `referencia=True` (fatia de um DataFrame mantido vivo pelo chamador) apenas guarda a referência.
+        """
+        with self._lock:
+            if chave in self:
+                self.remover(chave)
+
+            if referencia:
+                self._memoria[chave] = df
+                self._tamanhos[chave] = 0
+                return
+
+            tamanho = int(df.memory_usage(deep=True).sum())
+            if self.bytes_em_memoria + tamanho <= self.limite_bytes:
+                self._memoria[chave] = df
+                self._tamanhos[chave] = tamanho
+                self.bytes_em_memoria += tamanho
+                return
+
+            caminho = self._novo_caminho()
+
+        # A escrita fica fora do lock para não bloquear as outras threads durante o I/O.
+        try:
+            tabela = pa.Table.from_pandas(df, preserve_index=True)
+            with pa.OSFile(caminho, "wb") as arquivo, pa.ipc.new_file(arquivo, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+        except (pa.ArrowException, TypeError, ValueError):
+            # Colunas com tipos mistos não convertem para Arrow; usa pickle como alternativa.
+            caminho = f"{caminho[:-len('.arrow')]}.pkl"
+            df.to_pickle(caminho)
+        with self._lock:
+            self._em_disco[chave] = caminho
+        logger.info(f"💽 Buffer: '{chave}' ({tamanho / 1024 / 1024:.1f} MB) descarregado em disco.")
+
+    def carregar(self, chave: str, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+        """Devolve o DataFrame guardado (ou só `colunas`), relendo-o do disco se necessário."""
+        with self._lock:
+            if chave in self._memoria:
+                df = self._memoria[chave]
+                return df[colunas] if colunas else df
+            caminho = self._em_disco[chave]
+        if caminho.endswith(".pkl"):
+            df = pd.read_pickle(caminho)
+            return df[colunas] if colunas else df
+        with pa.memory_map(caminho, "r") as fonte:
+            tabela = pa.ipc.open_file(fonte).read_all()
+            if colunas:
+                # Só as colunas pedidas (e o índice) são convertidas; o resto nem chega a ser lido do disco.
+                indices = [c for c in tabela.schema.pandas_metadata["index_columns"] if isinstance(c, str)]
+                tabela = tabela.select(colunas + indices)
+            return tabela.to_pandas()
+
+    def remover(self, chave: str):
+        with self._lock:
+            if chave in self._memoria:
+                del self._memoria[chave]
+                self.bytes_em_memoria -= self._tamanhos.pop(chave)
+                return
+            caminho = self._em_disco.pop(chave, None)
+        if caminho:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+    def fechar(self):
+        """Libera a memória e apaga a pasta temporária."""
+        with self._lock:
+            self._memoria.clear()
+            self._tamanhos.clear()
+            self._em_disco.clear()
+            self.bytes_em_memoria = 0
+            if self._pasta:
+                shutil.rmtree(self._pasta, ignore_errors=True)
+                self._pasta = None
+
+
+_buffer_compartilhado: Optional[BufferDisco] = None
+_lock_buffer = threading.Lock()
+
+
+def buffer_compartilhado() -> BufferDisco:
+    """
+    Buffer único do processo: todas as etapas e destinos (inclusive os gravados em paralelo)
+    dividem o mesmo orçamento LIMITE_MEMORIA_BUFFER_MB. Use chaves com prefixo próprio.
+    """
+    global _buffer_compartilhado
+    with _lock_buffer:
+        if _buffer_compartilhado is None:
+            _buffer_compartilhado = BufferDisco()
+            atexit.register(_buffer_compartilhado.fechar)
+        return _buffer_compartilhado
@@ -1,3 +1,12 @@
+# Uma conexão "sql" pode declarar "endpoints" com papéis: "primario" (recebe as escritas) e
+# "leitura" (réplica read-intent, preferida pelas extrações). Cada endpoint herda os campos da
+# conexão e pode sobrescrevê-los, ou apontar para uma URL SQLAlchemy (ex.: um SQLite local em testes):
+#     "endpoints": [
+#         {"papel": "primario", "servidor": "spsvsql39"},
+#         {"papel": "leitura", "servidor": "<listener ou réplica secundária>"},
+#         {"papel": "leitura", "url": "sqlite:///replica_local.db"},
+#     ]
+# Sem "endpoints", a própria conexão é o único endpoint primário.
 CONEXOES = {
     "SPSVSQL39": {
         "tipo": "sql",
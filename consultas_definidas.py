@@ -1,19 +1,50 @@
-from typing import Dict
-from utils import carregar_sql
+from typing import Dict, List, Optional
+from utils import carregar_sql, envolver_consulta
 from conexoes import CONEXOES
 
 class Consulta:
-    def __init__(self, titulo: str, sql: str, tipo: str, conexao: str):
+    def __init__(self, titulo: str, sql: str, tipo: str, conexao: str,
+                 destinos: Optional[List[Dict]] = None,
+                 colunas: Optional[List[str]] = None,
+                 projecoes: Optional[Dict[str, List[str]]] = None):
         self.titulo = titulo
         self.tipo = tipo
         self.sql = sql
         self.conexao = conexao
+        # Cada destino recebe o mesmo extrato; ver destinos.py para os tipos suportados.
+        self.destinos = destinos or []
+        # Conjunto de colunas de saída da consulta (None = todas as do SELECT final) e
+        # subconjuntos nomeados que os destinos podem pedir com "projecao".
+        self.colunas = colunas
+        self.projecoes = projecoes or {}
 
         if conexao not in CONEXOES:
             raise ValueError(f"Conexão '{conexao}' não está definida em CONEXOES.py")
 
+        for nome, colunas_projecao in self.projecoes.items():
+            fora = [c for c in colunas_projecao if colunas is not None and c not in colunas]
+            if fora:
+                raise ValueError(f"Projeção '{nome}' usa colunas fora da consulta '{titulo}': {fora}")
+
+        for destino in self.destinos:
+            if destino.get("conexao") and destino["conexao"] not in CONEXOES:
+                raise ValueError(f"Conexão '{destino['conexao']}' do destino não está definida em CONEXOES.py")
+            if destino.get("projecao") and destino["projecao"] not in self.projecoes:
+                raise ValueError(f"Projeção '{destino['projecao']}' não está definida na consulta '{titulo}'.")
+
         self.info_conexao = CONEXOES[conexao]
 
+    def sql_para(self, colunas: Optional[List[str]] = None) -> str:
+        """
+        SQL que seleciona no servidor apenas as colunas pedidas (ou o conjunto declarado da consulta).
+        O SQL Server descarta das CTEs as colunas não usadas, reduzindo IO, rede e memória.
+        """
+        colunas = colunas or self.colunas
+        if not colunas:
+            return self.sql
+        lista = ", ".join(f"[{coluna}]" for coluna in colunas)
+        return envolver_consulta(self.sql, f"SELECT {lista} FROM __fonte")
+
 # --- CORREÇÃO DEFINITIVA ---
 # A chave aqui deve ser "FatoFechamento" para corresponder à chamada no main.py
 consultas: Dict[str, Consulta] = {
@@ -21,6 +52,26 @@ consultas: Dict[str, Consulta] = {
         titulo="FatoFechamento",
         tipo="sql",
         sql=carregar_sql("FatoFechamento.sql"),
-        conexao="SPSVSQL39"
+        conexao="SPSVSQL39",
+        projecoes={
+            # Chaves, datas e VALOR, sem os textos longos (COMPLEMENTO, FORNECEDOR, descrições).
+            "chaves_e_valor": ["CC", "CONTA", "VALOR", "IDRATEIO", "LCTREF", "IDPARTIDA", "IDMOV",
+                               "CODTMV", "DATAEMISSAO", "DATA", "TipoLancamento", "cdgContaNvl4"],
+        },
+        destinos=[
+            {"tipo": "sql", "tabela": "FatoFechamento_v2", "conexao": "SPSVSQL39"},
+            # Tabelas de resumo para os painéis, calculadas do mesmo extrato em memória.
+            {"tipo": "resumo", "tabela": "FatoFechamento_v2_resumo_conta", "conexao": "SPSVSQL39",
+             "dimensoes": ["ANO", "MES", "CONTA", "cdgContaNvl4", "TipoLancamento"]},
+            {"tipo": "resumo", "tabela": "FatoFechamento_v2_resumo_categoria", "conexao": "SPSVSQL39",
+             "dimensoes": ["ANO", "MES", "CATEGORIA", "TipoLancamento"]},
+            {"tipo": "resumo", "tabela": "FatoFechamento_v2_resumo_centro_custo", "conexao": "SPSVSQL39",
+             "dimensoes": ["ANO", "MES", "UNIDADE", "PROJETO", "ACAO", "TipoLancamento"]},
+            # Histórico versionado de cada fechamento (consulta com snapshots.carregar_versao).
+            {"tipo": "snapshot", "consulta": "FatoFechamento"},
+            # Outros consumidores são alimentados pelo mesmo extrato, por exemplo:
+            # {"tipo": "parquet", "caminho": "exportacoes/FatoFechamento.parquet"},
+            # {"tipo": "csv", "caminho": "exportacoes/FatoFechamento.csv", "projecao": "chaves_e_valor"},
+        ],
     )
 }
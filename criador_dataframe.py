@@ -1,15 +1,75 @@
 import pandas as pd
 import logging
+import time
+
+from perfilador import PerfilConsulta
 
 # Obtém o logger configurado em main.py
 logger = logging.getLogger("logger_financa")
 
 class CriadorDataFrame:
-    def __init__(self, funcao_conexao, conexao_nome, consulta, tipo):
+    def __init__(self, funcao_conexao, conexao_nome, consulta, tipo, liberar_engine=None,
+                 capturar_estatisticas=False, tamanho_lote=10000):
         self.funcao_conexao = funcao_conexao
         self.conexao_nome = conexao_nome
         self.consulta = consulta
         self.tipo = tipo
+        # Permite ao chamador manter a engine viva (pool compartilhado); por padrão ela é descartada.
+        self.liberar_engine = liberar_engine or (lambda e: e.dispose())
+        # Quando True, coleta as mensagens de SET STATISTICS IO, TIME do servidor.
+        self.capturar_estatisticas = capturar_estatisticas
+        self.tamanho_lote = tamanho_lote
+        self.perfil = PerfilConsulta()
+
+    @staticmethod
+    def _coletar_mensagens(cursor, perfil: PerfilConsulta):
+        # cursor.messages é específico do pyodbc; outros drivers simplesmente não o expõem.
+        for _, mensagem in getattr(cursor, "messages", None) or []:
+            perfil.mensagens_servidor.append(mensagem)
+
+    def _ler_sql_com_perfil(self, engine) -> pd.DataFrame:
+        """
+        Lê a consulta pelo cursor DBAPI, medindo separadamente a execução no servidor,
+        o tempo até a primeira linha, a transferência do restante e a montagem do DataFrame.
+        """
+        perfil = self.perfil
+        with engine.connect() as connection:
+            cursor = connection.connection.cursor()
+            try:
+                if self.capturar_estatisticas:
+                    cursor.execute("SET STATISTICS IO, TIME ON")
+
+                inicio = time.perf_counter()
+                cursor.execute(self.consulta)
+                perfil.fases["execucao_servidor"] = time.perf_counter() - inicio
+                colunas = [descricao[0] for descricao in cursor.description]
+
+                inicio = time.perf_counter()
+                linhas = cursor.fetchmany(1)
+                perfil.fases["primeira_linha"] = time.perf_counter() - inicio
+
+                inicio = time.perf_counter()
+                while True:
+                    lote = cursor.fetchmany(self.tamanho_lote)
+                    if not lote:
+                        break
+                    linhas.extend(lote)
+                perfil.fases["transferencia"] = time.perf_counter() - inicio
+
+                if self.capturar_estatisticas:
+                    self._coletar_mensagens(cursor, perfil)
+                    while cursor.nextset():
+                        self._coletar_mensagens(cursor, perfil)
+                    cursor.execute("SET STATISTICS IO, TIME OFF")
+            finally:
+                cursor.close()
+
+        inicio = time.perf_counter()
+        # Mesma construção usada internamente por pd.read_sql_query.
+        df = pd.DataFrame.from_records(linhas, columns=colunas, coerce_float=True)
+        perfil.fases["construcao_dataframe"] = time.perf_counter() - inicio
+        perfil.linhas = len(df)
+        return df
 
     def executar(self) -> pd.DataFrame:
         """
@@ -18,12 +78,13 @@ class CriadorDataFrame:
         engine = None
         try:
             # Obtém uma engine de conexão
-            engine = self.funcao_conexao(self.conexao_nome)
+            # Extrações podem ser atendidas por uma réplica de leitura.
+            engine = self.funcao_conexao(self.conexao_nome, finalidade="leitura")
             if not engine:
                  raise ConnectionError(f"A função de conexão não retornou uma engine para '{self.conexao_nome}'.")
             
             if self.tipo == "sql":
-                return pd.read_sql_query(self.consulta, engine)
+                return self._ler_sql_com_perfil(engine)
             else:
                 raise NotImplementedError(f"O tipo de consulta '{self.tipo}' não está implementado.")
                 
@@ -32,4 +93,4 @@ class CriadorDataFrame:
             raise e
         finally:
              if engine:
-                  engine.dispose()
+                  self.liberar_engine(engine)
@@ -0,0 +1,195 @@
+# destinos.py
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from funcoes_globais import FalhaSistemica, salvar_no_financa
+from resumos import DIMENSOES_DE_DATA, calcular_resumo
+from snapshots import PASTA_SNAPSHOTS, salvar_snapshot
+
+logger = logging.getLogger("logger_financa")
+
+
+class Destino:
+    """
+    Consumidor de um extrato já carregado em memória.
+    `colunas` é o subconjunto de colunas que o destino recebe (None = todas).
+    """
+
+    def __init__(self, nome: str, tentativas: int = 3, delay_segundos: int = 10,
+                 colunas: Optional[List[str]] = None):
+        self.nome = nome
+        self.tentativas = tentativas
+        self.delay_segundos = delay_segundos
+        self.colunas = colunas
+
+    def escrever(self, df: pd.DataFrame) -> Optional[Dict]:
+        """Grava o extrato; pode retornar detalhes adicionais para o status do destino."""
+        raise NotImplementedError
+
+
+class DestinoTabelaSQL(Destino):
+    """Tabela no SQL Server, gravada por `salvar_no_financa` (serve também para um banco secundário)."""
+
+    def __init__(self, tabela: str, conexao: str = "SPSVSQL39", **kwargs):
+        super().__init__(f"sql:{conexao}.{tabela}", **kwargs)
+        self.tabela = tabela
+        self.conexao = conexao
+
+    def escrever(self, df: pd.DataFrame) -> Dict:
+        return salvar_no_financa(df, self.tabela, conexao=self.conexao)
+
+
+class DestinoResumo(DestinoTabelaSQL):
+    """Tabela de resumo (ex.: VALOR por mês e CONTA) calculada a partir do extrato em memória."""
+
+    def __init__(self, tabela: str, dimensoes: List[str], conexao: str = "SPSVSQL39", **kwargs):
+        # O resumo precisa apenas das dimensões (DATA para ANO/MES) e de VALOR.
+        kwargs["colunas"] = list(dict.fromkeys(
+            (["DATA"] if any(d in DIMENSOES_DE_DATA for d in dimensoes) else [])
+            + [d for d in dimensoes if d not in DIMENSOES_DE_DATA] + ["VALOR"]
+        ))
+        super().__init__(tabela, conexao, **kwargs)
+        self.nome = f"resumo:{conexao}.{tabela}"
+        self.dimensoes = dimensoes
+
+    def escrever(self, df: pd.DataFrame) -> Dict:
+        return super().escrever(calcular_resumo(df, self.dimensoes))
+
+
+class DestinoArquivo(Destino):
+    """Exportação para arquivo; grava em um temporário e renomeia para não deixar arquivo parcial."""
+
+    formato = ""
+
+    def __init__(self, caminho: str, **kwargs):
+        super().__init__(f"{self.formato}:{caminho}", **kwargs)
+        self.caminho = caminho
+
+    def _gravar(self, df: pd.DataFrame, caminho: str):
+        raise NotImplementedError
+
+    def escrever(self, df: pd.DataFrame):
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        temporario = f"{self.caminho}.tmp"
+        self._gravar(df, temporario)
+        os.replace(temporario, self.caminho)
+
+
+class DestinoParquet(DestinoArquivo):
+    formato = "parquet"
+
+    def _gravar(self, df: pd.DataFrame, caminho: str):
+        df.to_parquet(caminho, index=False, compression="zstd")
+
+
+class DestinoCSV(DestinoArquivo):
+    formato = "csv"
+
+    def _gravar(self, df: pd.DataFrame, caminho: str):
+        df.to_csv(caminho, index=False, sep=";", encoding="utf-8-sig")
+
+
+class DestinoSnapshot(Destino):
+    """Versão histórica do extrato, com partições inalteradas compartilhadas entre versões (ver snapshots.py)."""
+
+    def __init__(self, consulta: str, pasta: str = PASTA_SNAPSHOTS, **kwargs):
+        super().__init__(f"snapshot:{consulta}", **kwargs)
+        self.consulta = consulta
+        self.pasta = pasta
+
+    def escrever(self, df: pd.DataFrame) -> Dict:
+        return {"versao": salvar_snapshot(df, self.consulta, self.pasta)}
+
+
+TIPOS_DESTINO = {
+    "sql": DestinoTabelaSQL,
+    "resumo": DestinoResumo,
+    "parquet": DestinoParquet,
+    "csv": DestinoCSV,
+    "snapshot": DestinoSnapshot,
+}
+
+
+def criar_destino(definicao: Dict, projecoes: Optional[Dict[str, List[str]]] = None) -> Destino:
+    """
+    Cria um destino a partir da definição declarada na `Consulta` (ex.: {"tipo": "csv", "caminho": ...}).
+    Uma "projecao" é resolvida para a lista de colunas correspondente em `projecoes`.
+    """
+    parametros = dict(definicao)
+    tipo = parametros.pop("tipo", None)
+    if tipo not in TIPOS_DESTINO:
+        raise ValueError(f"Tipo de destino '{tipo}' não suportado. Opções: {list(TIPOS_DESTINO)}")
+    projecao = parametros.pop("projecao", None)
+    if projecao:
+        parametros["colunas"] = (projecoes or {})[projecao]
+    return TIPOS_DESTINO[tipo](**parametros)
+
+
+def criar_destinos(consulta) -> List[Destino]:
+    """Instancia todos os destinos declarados na `Consulta`."""
+    return [criar_destino(definicao, consulta.projecoes) for definicao in consulta.destinos]
+
+
+def colunas_necessarias(destinos: List[Destino], colunas_consulta: Optional[List[str]] = None) -> Optional[List[str]]:
+    """
+    União das colunas pedidas pelos destinos, na ordem da consulta quando ela declara suas colunas.
+    Retorna None se algum destino precisa de todas as colunas (nesse caso vale o conjunto da consulta).
+    """
+    if not destinos or any(destino.colunas is None for destino in destinos):
+        return colunas_consulta
+    uniao = list(dict.fromkeys(coluna for destino in destinos for coluna in destino.colunas))
+    if colunas_consulta:
+        return [coluna for coluna in colunas_consulta if coluna in uniao]
+    return uniao
+
+
+def _escrever_com_retry(destino: Destino, df: pd.DataFrame) -> Dict:
+    inicio = time.perf_counter()
+    # A seleção de colunas é uma cópia: feita aqui, ela só existe enquanto este destino está sendo gravado.
+    if destino.colunas:
+        df = df[destino.colunas]
+    for tentativa in range(1, destino.tentativas + 1):
+        try:
+            logger.info(f"  -> Gravando destino '{destino.nome}' (tentativa {tentativa}/{destino.tentativas})...")
+            detalhes = destino.escrever(df)
+            tempo = time.perf_counter() - inicio
+            logger.info(f"  ✅ Destino '{destino.nome}' gravado em {tempo:.2f} segundos.")
+            return {"status": "SUCESSO", "tentativas": tentativa, "tempo": tempo, "erro": None,
+                    "detalhes": detalhes or {}}
+        except Exception as e:
+            # Uma falha sistêmica se repetiria a cada tentativa (e cada uma recria a tabela do zero).
+            sistemica = isinstance(e, FalhaSistemica)
+            if tentativa < destino.tentativas and not sistemica:
+                logger.warning(f"  ⚠️ Falha no destino '{destino.nome}': {e}. Nova tentativa em {destino.delay_segundos}s...")
+                time.sleep(destino.delay_segundos)
+            else:
+                motivo = "por falha sistêmica" if sistemica else f"após {destino.tentativas} tentativas"
+                logger.error(f"  ❌ Destino '{destino.nome}' falhou {motivo}.", exc_info=True)
+                return {"status": "FALHA", "tentativas": tentativa,
+                        "tempo": time.perf_counter() - inicio, "erro": str(e), "detalhes": {}}
+
+
+def gravar_em_destinos(df: pd.DataFrame, destinos: List[Destino], max_paralelo: int = 4) -> Dict[str, Dict]:
+    """
+    Alimenta todos os destinos a partir de um único extrato, em paralelo.
+    Cada destino recebe apenas as suas colunas e tem retry e status independentes;
+    a falha de um não interrompe os demais. Retorna um dicionário {nome_do_destino: status}.
+    """
+    if not destinos:
+        logger.warning("⚠️ Nenhum destino configurado. Nada será gravado.")
+        return {}
+
+    logger.info(f"🚚 Gravando {len(df)} linhas em {len(destinos)} destino(s) em paralelo...")
+    with ThreadPoolExecutor(max_workers=min(max_paralelo, len(destinos)), thread_name_prefix="destino") as executor:
+        futuros = {
+            destino.nome: executor.submit(_escrever_com_retry, destino, df)
+            for destino in destinos
+        }
+        return {nome: futuro.result() for nome, futuro in futuros.items()}
@@ -6,39 +6,135 @@ import os
 import pyodbc
 from urllib.parse import quote_plus
 from sqlalchemy import create_engine, text, engine
-import numpy as np
 import math
-from typing import Optional
+import re
+import threading
+from typing import Dict, Optional
 
 # Suas importações personalizadas
 from conexoes import CONEXOES
 from consultas_definidas import consultas
+from buffer_disco import BufferDisco, buffer_compartilhado
 from criador_dataframe import CriadorDataFrame
+from perfilador import detectar_regressoes, registrar_perfil
 
 logger = logging.getLogger("logger_financa")
 
+# Engines reaproveitadas entre execuções quando o processo fica residente (ver servico.py),
+# uma por endpoint: a escolha do endpoint (saúde, latência, cooldown) é refeita a cada chamada.
+_engines_compartilhadas: Dict[str, engine.Engine] = {}
+_lock_engines = threading.Lock()
+_manter_conexoes_ativas = False
+
+
+def manter_conexoes_ativas(ativo: bool = True):
+    """
+    Liga/desliga o reaproveitamento de engines. Quando ligado, `funcao_conexao` devolve sempre
+    a mesma engine por endpoint e `liberar_engine` não a descarta, mantendo o pool aquecido.
+    """
+    global _manter_conexoes_ativas
+    _manter_conexoes_ativas = ativo
+    if not ativo:
+        encerrar_conexoes()
+
+
+def liberar_engine(engine_instance):
+    """Descarta a engine ao fim do uso, exceto quando ela pertence ao pool compartilhado."""
+    if engine_instance is None or isinstance(engine_instance, str):
+        return
+    if _manter_conexoes_ativas and engine_instance in _engines_compartilhadas.values():
+        return
+    engine_instance.dispose()
+
+
+def encerrar_conexoes():
+    """Descarta todas as engines compartilhadas (usado no desligamento do serviço)."""
+    with _lock_engines:
+        for identificador, engine_instance in _engines_compartilhadas.items():
+            engine_instance.dispose()
+            logger.info(f"🔌 Conexão com '{identificador}' encerrada.")
+        _engines_compartilhadas.clear()
+
+
+def _descartar_engine(identificador: str, engine_instance) -> None:
+    """Descarta a engine de um endpoint que falhou, retirando-a do pool compartilhado."""
+    if engine_instance is None:
+        return
+    with _lock_engines:
+        if _engines_compartilhadas.get(identificador) is engine_instance:
+            del _engines_compartilhadas[identificador]
+    engine_instance.dispose()
+
+
+def esquema_padrao(engine_instance) -> Optional[str]:
+    """Esquema das tabelas carregadas: 'dbo' no SQL Server; nenhum nos substitutos locais (ex.: SQLite)."""
+    return "dbo" if engine_instance.dialect.name == "mssql" else None
+
+
+def tabela_qualificada(engine_instance, tabela: str) -> str:
+    """Nome da tabela para SQL literal, com o esquema padrão do banco quando houver."""
+    esquema = esquema_padrao(engine_instance)
+    return f'{esquema}."{tabela}"' if esquema else f'"{tabela}"'
+
 
 def funcao_conexao(
-    nome_conexao: str, tentativas: int = 3, delay_segundos: int = 10
+    nome_conexao: str, tentativas: int = 3, delay_segundos: int = 10, finalidade: str = "escrita"
 ) -> Optional[engine.Engine]:
     """
     Cria uma engine SQLAlchemy com lógica de retry, configuração de segurança e otimização de escrita.
+    `finalidade="leitura"` direciona a conexão para réplicas de leitura (se houver endpoints com
+    papel "leitura"), com fallback para o primário; escrita vai sempre para o primário.
+    Com `manter_conexoes_ativas()` ligado, reaproveita a engine já criada para o endpoint escolhido;
+    a escolha continua sendo feita a cada chamada, e a engine de um endpoint que falha é descartada.
     """
-    info = CONEXOES.get(nome_conexao)
-    if not info:
-        logger.error(f"Conexão '{nome_conexao}' não encontrada nas definições.")
-        return None
+    if finalidade not in ("leitura", "escrita"):
+        raise ValueError(f"Finalidade '{finalidade}' inválida. Use 'leitura' ou 'escrita'.")
 
-    tipo_conexao = info.get("tipo")
-    if tipo_conexao == "olap":
-        return info.get("str_conexao")
-    
-    if tipo_conexao != "sql":
-        raise ValueError(f"Tipo de conexão '{tipo_conexao}' não suportado.")
+    return _criar_engine(nome_conexao, tentativas, delay_segundos, finalidade, compartilhar=_manter_conexoes_ativas)
+
+
+# Saúde dos endpoints: última latência medida (s) e momento da última falha.
+_saude_endpoints: Dict[str, Dict[str, float]] = {}
+# Um endpoint que falhou só volta a ser preferido depois deste intervalo.
+COOLDOWN_ENDPOINT_SEGUNDOS = 300
 
-    driver = info["driver"].replace('+', ' ')
-    servidor = info["servidor"]
-    banco = info["banco"]
+
+def _endpoints_para(info: dict, finalidade: str) -> list:
+    """
+    Lista os endpoints candidatos na ordem de preferência. Cada endpoint herda os campos da
+    conexão (servidor, banco, driver...) e pode sobrescrevê-los, ou informar uma "url" SQLAlchemy.
+    Sem "endpoints", a própria conexão é o único endpoint primário.
+    """
+    endpoints = [{**info, **endpoint} for endpoint in info.get("endpoints", [])] or [{**info, "papel": "primario"}]
+    primarios = [e for e in endpoints if e.get("papel", "primario") == "primario"]
+    replicas = [e for e in endpoints if e.get("papel") == "leitura"]
+    if not primarios:
+        raise ValueError("A conexão precisa de ao menos um endpoint com papel 'primario'.")
+
+    agora = time.monotonic()
+
+    def ordem(endpoint):
+        saude = _saude_endpoints.get(_identificar_endpoint(endpoint), {})
+        em_cooldown = agora - saude.get("falhou_em", -COOLDOWN_ENDPOINT_SEGUNDOS) < COOLDOWN_ENDPOINT_SEGUNDOS
+        # Endpoints em cooldown ficam por último; entre os demais, réplicas antes do primário.
+        return (em_cooldown, endpoint.get("papel") != "leitura", saude.get("latencia", 0.0))
+
+    if finalidade == "leitura":
+        return sorted(replicas + primarios, key=ordem)
+    return sorted(primarios, key=ordem)
+
+
+def _identificar_endpoint(endpoint: dict) -> str:
+    return endpoint.get("url") or f"{endpoint['servidor']}/{endpoint['banco']}"
+
+
+def _montar_url(endpoint: dict) -> str:
+    if endpoint.get("url"):
+        return endpoint["url"]
+
+    driver = endpoint["driver"].replace('+', ' ')
+    servidor = endpoint["servidor"]
+    banco = endpoint["banco"]
 
     params = {
         "DRIVER": f"{{{driver}}}",
@@ -49,27 +145,96 @@ def funcao_conexao(
         "TrustServerCertificate": "yes"
     }
 
-    if info.get("trusted_connection", False):
+    if endpoint.get("trusted_connection", False):
         params["Trusted_Connection"] = "yes"
+
+    if endpoint.get("papel") == "leitura":
+        # Permite o roteamento de leitura do Availability Group para uma réplica secundária.
+        params["ApplicationIntent"] = "ReadOnly"
     
     odbc_str = ";".join(f"{key}={value}" for key, value in params.items())
-    string_conexao_url = f"mssql+pyodbc:///?odbc_connect={quote_plus(odbc_str)}"
+    return f"mssql+pyodbc:///?odbc_connect={quote_plus(odbc_str)}"
+
+
+def _criar_engine(
+    nome_conexao: str, tentativas: int = 3, delay_segundos: int = 10, finalidade: str = "escrita",
+    compartilhar: bool = False
+) -> Optional[engine.Engine]:
+    info = CONEXOES.get(nome_conexao)
+    if not info:
+        logger.error(f"Conexão '{nome_conexao}' não encontrada nas definições.")
+        return None
+
+    tipo_conexao = info.get("tipo")
+    if tipo_conexao == "olap":
+        return info.get("str_conexao")
+    
+    if tipo_conexao != "sql":
+        raise ValueError(f"Tipo de conexão '{tipo_conexao}' não suportado.")
+
+    candidatos = _endpoints_para(info, finalidade)
+    ultimo_erro = None
+    for posicao, endpoint in enumerate(candidatos):
+        identificador = _identificar_endpoint(endpoint)
+        try:
+            return _conectar_endpoint(nome_conexao, endpoint, tentativas, delay_segundos, compartilhar)
+        except Exception as e:
+            ultimo_erro = e
+            _saude_endpoints.setdefault(identificador, {})["falhou_em"] = time.monotonic()
+            if posicao < len(candidatos) - 1:
+                logger.warning(f"⚠️ Endpoint '{identificador}' de '{nome_conexao}' indisponível; tentando o próximo.")
+
+    logger.error(f"❌ Nenhum endpoint de '{nome_conexao}' ({finalidade}) está disponível.", exc_info=ultimo_erro)
+    raise ultimo_erro
+
+
+def _conectar_endpoint(
+    nome_conexao: str, endpoint: dict, tentativas: int, delay_segundos: int, compartilhar: bool = False
+) -> engine.Engine:
+    """
+    Conecta ao endpoint e mede a latência com um SELECT 1. Com `compartilhar`, reaproveita a engine
+    já aberta para o endpoint (o SELECT 1 confirma que ele continua saudável) ou guarda a nova.
+    """
+    string_conexao_url = _montar_url(endpoint)
+    identificador = _identificar_endpoint(endpoint)
+    opcoes = {"pool_pre_ping": True, "pool_recycle": 300}
+    if string_conexao_url.startswith("mssql+pyodbc"):
+        # --- ALTERAÇÃO 1: Adicionado fast_executemany=True para otimizar a performance. ---
+        opcoes["fast_executemany"] = True  # Otimização chave para bulk insert no SQL Server
 
     for tentativa in range(tentativas):
+        engine_instance = None
         try:
-            # --- ALTERAÇÃO 1: Adicionado fast_executemany=True para otimizar a performance. ---
-            engine_instance = create_engine(
-                string_conexao_url,
-                pool_pre_ping=True,
-                pool_recycle=300,
-                fast_executemany=True  # Otimização chave para bulk insert no SQL Server
-            )
+            if compartilhar:
+                with _lock_engines:
+                    engine_instance = _engines_compartilhadas.get(identificador)
+            reaproveitada = engine_instance is not None
+            if not reaproveitada:
+                engine_instance = create_engine(string_conexao_url, **opcoes)
             
-            with engine_instance.connect():
-                logger.info(f"✅ Conexão com '{nome_conexao}' estabelecida (fast_executemany=True, pool_recycle=300s).")
+            inicio = time.perf_counter()
+            with engine_instance.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            latencia = time.perf_counter() - inicio
+            _saude_endpoints[identificador] = {"latencia": latencia}
+            if reaproveitada:
                 return engine_instance
 
+            if compartilhar:
+                with _lock_engines:
+                    compartilhada = _engines_compartilhadas.setdefault(identificador, engine_instance)
+                if compartilhada is not engine_instance:
+                    # Outra thread abriu o mesmo endpoint ao mesmo tempo; fica valendo a dela.
+                    engine_instance.dispose()
+                    return compartilhada
+            logger.info(
+                f"✅ Conexão com '{nome_conexao}' estabelecida em '{identificador}' "
+                f"(papel={endpoint.get('papel', 'primario')}, latência={latencia * 1000:.0f} ms, pool_recycle=300s)."
+            )
+            return engine_instance
+
         except pyodbc.OperationalError as e:
+            _descartar_engine(identificador, engine_instance)
             if '08S01' in str(e) and tentativa < tentativas - 1:
                 logger.warning(
                     f"⚠️ Falha de comunicação ao conectar com '{nome_conexao}'. "
@@ -78,17 +243,25 @@ def funcao_conexao(
                 )
                 time.sleep(delay_segundos)
             else:
-                logger.error(f"Erro final de conexão na tentativa {tentativa + 1}.", exc_info=True)
+                # Só um aviso: o chamador ainda pode seguir para o próximo endpoint (ver `_criar_engine`).
+                logger.warning(f"⚠️ Erro final de conexão com '{identificador}' na tentativa {tentativa + 1}: {e}")
                 raise e
         except Exception as e:
-            logger.error(f"Erro inesperado ao criar a engine para '{nome_conexao}'.", exc_info=True)
+            _descartar_engine(identificador, engine_instance)
+            logger.warning(f"⚠️ Erro inesperado ao criar a engine para '{identificador}': {e}")
             raise e
 
     raise ConnectionError(f"Não foi possível conectar a '{nome_conexao}' após {tentativas} tentativas.")
 
 
-def selecionar_consulta_por_nome(titulo: str) -> pd.DataFrame:
-    """Executa a consulta pelo nome e retorna um DataFrame."""
+def selecionar_consulta_por_nome(
+    titulo: str, capturar_estatisticas: bool = False, colunas: Optional[list] = None
+) -> pd.DataFrame:
+    """
+    Executa a consulta pelo nome e retorna um DataFrame.
+    Com `colunas`, apenas essas colunas são selecionadas no servidor (projeção).
+    Os tempos por fase são gravados no histórico local (perfilador.py) e comparados com a linha de base.
+    """
     logger.info(f"▶️ Executando a consulta: '{titulo}'...")
     inicio = time.perf_counter()
     try:
@@ -98,12 +271,16 @@ def selecionar_consulta_por_nome(titulo: str) -> pd.DataFrame:
 
         tipo_correto = "mdx" if consulta_encontrada.tipo == "olap" else consulta_encontrada.tipo
         
-        df = CriadorDataFrame(
+        criador = CriadorDataFrame(
             funcao_conexao,
             consulta_encontrada.conexao,
-            consulta_encontrada.sql,
-            tipo_correto
-        ).executar()
+            consulta_encontrada.sql_para(colunas),
+            tipo_correto,
+            liberar_engine=liberar_engine,
+            capturar_estatisticas=capturar_estatisticas
+        )
+        df = criador.executar()
+        _registrar_perfil_consulta(titulo, criador.perfil)
         
         fim = time.perf_counter()
         tempo = fim - inicio
@@ -118,26 +295,180 @@ def selecionar_consulta_por_nome(titulo: str) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def salvar_no_financa(df: pd.DataFrame, table_name: str, retries_per_chunk: int = 3):
+def _registrar_perfil_consulta(titulo: str, perfil) -> None:
+    """Loga as fases da consulta, grava no histórico e alerta sobre regressões (nunca interrompe o pipeline)."""
+    logger.info(f"⏱️ Perfil de '{titulo}': {perfil.resumo()}")
+    if perfil.mensagens_servidor:
+        logger.info(f"⏱️ Estatísticas do servidor para '{titulo}': {perfil.estatisticas_servidor()}")
+    try:
+        registrar_perfil(titulo, perfil)
+        for regressao in detectar_regressoes(titulo):
+            logger.warning(f"⚠️ Possível regressão em '{titulo}': {regressao}")
+    except Exception as e:
+        logger.warning(f"⚠️ Não foi possível gravar o histórico de desempenho de '{titulo}': {e}")
+
+
+# Acima deste número de linhas rejeitadas a falha é considerada sistêmica (ex.: esquema incompatível)
+# e o salvamento é abortado em vez de continuar dividindo blocos.
+LIMITE_LINHAS_QUARENTENA = 1000
+
+# Linhas por bloco gravado na 1ª rodada.
+TAMANHO_BLOCO = 10000
+# Isolar uma linha custa duas gravações por nível de divisão do bloco. O teto de gravações cresce
+# com as linhas já isoladas, então só interrompe o isolamento quando ele custa mais do que isso.
+GRAVACOES_POR_LINHA_ISOLADA = 2 * math.ceil(math.log2(TAMANHO_BLOCO)) + 2
+
+# Falhas que justificam retentar o bloco inteiro: rede, deadlock e timeouts.
+SQLSTATES_TRANSITORIOS = {"08S01", "40001", "HYT00", "HYT01"}
+
+
+class FalhaSistemica(RuntimeError):
+    """Falha que se repete em todo o bloco (ex.: esquema incompatível); retentar a carga não adianta."""
+
+
+class _Quarentena(list):
+    """Linhas rejeitadas (rótulo, linhas, erro) e o número de gravações gastas para isolá-las."""
+
+    def __init__(self):
+        super().__init__()
+        self.gravacoes = 0
+
+
+def _sqlstate(e: Exception) -> Optional[str]:
+    """SQLSTATE do erro do driver (o pyodbc o traz em args[0]; o SQLAlchemy guarda o erro original em `orig`)."""
+    original = getattr(e, "orig", None) or e
+    if original.args and isinstance(original.args[0], str) and re.fullmatch(r"[0-9A-Z]{5}", original.args[0]):
+        return original.args[0]
+    encontrado = re.search(r"\[([0-9A-Z]{5})\]", str(e))
+    return encontrado.group(1) if encontrado else None
+
+
+def _falha_de_comunicacao(e: Exception) -> bool:
+    """Erros de rede (SQLSTATE 08S01)."""
+    return '08S01' in str(e)
+
+
+def _falha_transitoria(e: Exception) -> bool:
+    """Rede, deadlock (1205/40001) ou timeout (HYT00): o mesmo bloco tende a passar numa nova tentativa."""
+    return _falha_de_comunicacao(e) or _sqlstate(e) in SQLSTATES_TRANSITORIOS
+
+
+def _falha_de_dados(e: Exception) -> bool:
+    """Erros de dados (SQLSTATE 22xxx, ex.: conversão/truncamento, e 23xxx, restrições): vale isolar as linhas."""
+    sqlstate = _sqlstate(e)
+    return sqlstate is not None and sqlstate[:2] in ("22", "23")
+
+
+def _primeira_linha(e: Exception) -> str:
+    return str(e).splitlines()[0] if str(e) else type(e).__name__
+
+
+def _isolar_linhas_com_falha(
+    engine, chunk_df: pd.DataFrame, table_name: str, erro: Exception, rotulo: str,
+    quarentena: _Quarentena, pendentes: BufferDisco, prefixo: str
+) -> int:
+    """
+    Divide recursivamente um bloco que falhou por erro de dados, gravando as metades válidas e
+    isolando as linhas problemáticas em `quarentena` (com a mensagem de erro). Partes que falharem
+    por outro motivo vão para `pendentes`, com chaves iniciadas por `prefixo` (2ª rodada).
+    Levanta `FalhaSistemica` se as linhas rejeitadas passarem de LIMITE_LINHAS_QUARENTENA ou o
+    isolamento gastar mais de GRAVACOES_POR_LINHA_ISOLADA gravações por linha isolada.
+    Retorna as linhas salvas.
+    """
+    if len(quarentena) >= LIMITE_LINHAS_QUARENTENA:
+        raise FalhaSistemica(
+            f"Mais de {LIMITE_LINHAS_QUARENTENA} linhas rejeitadas; a falha parece sistêmica. Último erro: {erro}"
+        )
+    if quarentena.gravacoes > GRAVACOES_POR_LINHA_ISOLADA * (len(quarentena) + 1):
+        raise FalhaSistemica(
+            f"Isolamento interrompido após {quarentena.gravacoes} gravações; a falha parece sistêmica. Último erro: {erro}"
+        )
+    if len(chunk_df) == 1:
+        logger.warning(f"  🚫 Linha {chunk_df.index[0]} do bloco {rotulo} em quarentena: {_primeira_linha(erro)[:300]}")
+        quarentena.append((rotulo, chunk_df, str(erro)))
+        return 0
+
+    meio = len(chunk_df) // 2
+    linhas_salvas = 0
+    partes_com_falha = []
+    for parte in (chunk_df.iloc[:meio], chunk_df.iloc[meio:]):
+        quarentena.gravacoes += 1
+        try:
+            with engine.begin() as connection:
+                parte.to_sql(name=table_name, con=connection, if_exists='append', index=False, schema=esquema_padrao(engine))
+            linhas_salvas += len(parte)
+        except Exception as e:
+            if _falha_de_dados(e):
+                partes_com_falha.append((parte, e))
+            else:
+                pendentes.guardar(
+                    f"{prefixo}{rotulo} (linhas {parte.index[0]}-{parte.index[-1]})", parte, referencia=True
+                )
+
+    for parte, e in partes_com_falha:
+        linhas_salvas += _isolar_linhas_com_falha(
+            engine, parte, table_name, e, rotulo, quarentena, pendentes, prefixo
+        )
+    return linhas_salvas
+
+
+def _gravar_quarentena(engine, table_name: str, quarentena: list) -> int:
+    """
+    Grava as linhas rejeitadas na tabela '<tabela>_quarentena' (valores como texto, para que a
+    gravação não falhe pelo mesmo motivo). Se a tabela não puder ser gravada, usa um CSV em logs/quarentena.
+    """
+    df_quarentena = pd.concat(
+        [linhas.astype(str).assign(BLOCO=rotulo, LINHA=linhas.index, ERRO=erro[:4000])
+         for rotulo, linhas, erro in quarentena],
+        ignore_index=True
+    )
+    df_quarentena["DATA_QUARENTENA"] = pd.Timestamp.now()
+    tabela_quarentena = f"{table_name}_quarentena"
+    try:
+        with engine.begin() as connection:
+            df_quarentena.to_sql(name=tabela_quarentena, con=connection, if_exists='append', index=False, schema=esquema_padrao(engine))
+        logger.warning(f"🚫 {len(df_quarentena)} linhas gravadas na tabela de quarentena '{tabela_quarentena}'.")
+    except Exception as e:
+        os.makedirs(os.path.join("logs", "quarentena"), exist_ok=True)
+        caminho = os.path.join("logs", "quarentena", f"{tabela_quarentena}_{time.strftime('%Y-%m-%d_%H%M%S')}.csv")
+        df_quarentena.to_csv(caminho, index=False, sep=";", encoding="utf-8-sig")
+        logger.warning(f"🚫 Tabela de quarentena indisponível ({e}); {len(df_quarentena)} linhas gravadas em '{caminho}'.")
+    return len(df_quarentena)
+
+
+def salvar_no_financa(
+    df: pd.DataFrame, table_name: str, retries_per_chunk: int = 3, conexao: str = "SPSVSQL39"
+) -> dict:
     """
     Salva o DataFrame no SQL Server usando um método otimizado (fast_executemany)
     e uma lógica robusta de retries em blocos (chunks).
+    Blocos que falham por dados inválidos (SQLSTATE 22xxx/23xxx) são divididos até isolar as
+    linhas problemáticas, que vão para a quarentena; as demais são gravadas normalmente.
+    Falhas transitórias (rede, deadlock, timeout) são retentadas; falhas sistêmicas levantam `FalhaSistemica`.
+    Blocos aguardando a 2ª rodada são fatias de `df` (sem cópia) registradas no buffer
+    compartilhado do processo, sob o prefixo '<tabela>/'.
+    Retorna {"linhas_salvas": ..., "linhas_quarentena": ...}.
     """
     if df.empty:
         logger.warning(f"⚠️ DataFrame está vazio. Nada será salvo.")
-        return
+        return {"linhas_salvas": 0, "linhas_quarentena": 0}
 
     logger.info(f"📀 Iniciando processo de salvamento para a tabela '{table_name}'.")
     inicio_total = time.perf_counter()
     engine = None
     
-    blocos_com_falha_persistente_primeira_rodada = [] 
+    blocos_com_falha_persistente_primeira_rodada = buffer_compartilhado()
+    prefixo_blocos = f"{table_name}/"
+    prefixo_segunda_rodada = f"{table_name}/2ª rodada/"
+    blocos_com_falha_final = []
+    quarentena = _Quarentena()
+    linhas_salvas = 0
 
     try:
-        engine = funcao_conexao("SPSVSQL39")
+        engine = funcao_conexao(conexao)
         
         # --- ALTERAÇÃO 2: Ajuste do chunksize para um valor maior e mais eficiente. ---
-        chunksize = 10000
+        chunksize = TAMANHO_BLOCO
         
         total_rows = len(df)
         num_chunks = math.ceil(total_rows / chunksize) if chunksize > 0 else 1
@@ -145,10 +476,12 @@ def salvar_no_financa(df: pd.DataFrame, table_name: str, retries_per_chunk: int
         with engine.begin() as connection:
             logger.info(f"🗑️ Removendo a tabela antiga '{table_name}' (se existir)...")
             connection.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+            connection.execute(text(f'DROP TABLE IF EXISTS "{table_name}_quarentena"'))
             logger.info(f"✅ Tabela removida.")
             
         logger.info(f"💾 Iniciando 1ª RODADA: Salvando {total_rows} linhas em {num_chunks} blocos de ~{chunksize} linhas.")
-        chunks = np.array_split(df, num_chunks) if num_chunks > 1 else [df]
+        # Fatias geradas sob demanda, para não manter uma segunda cópia do DataFrame inteiro em blocos.
+        chunks = (df.iloc[inicio:inicio + chunksize] for inicio in range(0, total_rows, chunksize))
 
         for i, chunk_df in enumerate(chunks):
             bloco_atual = i + 1
@@ -164,56 +497,94 @@ def salvar_no_financa(df: pd.DataFrame, table_name: str, retries_per_chunk: int
                              logger.info(f"  -> Salvando bloco {bloco_atual}/{num_chunks} ({len(chunk_df)} linhas)...")
                         
                         # Removido 'method=multi' para deixar o fast_executemany atuar
-                        chunk_df.to_sql(name=table_name, con=connection, if_exists='append', index=False, schema='dbo')
+                        chunk_df.to_sql(name=table_name, con=connection, if_exists='append', index=False, schema=esquema_padrao(engine))
                         sucesso_chunk_atual = True
+                        linhas_salvas += len(chunk_df)
                 
-                except pyodbc.OperationalError as e:
+                except Exception as e:
+                    if _falha_de_dados(e):
+                        logger.error(f"  ❌ Erro de dados no bloco {bloco_atual}; isolando as linhas com problema...", exc_info=True)
+                        linhas_salvas += _isolar_linhas_com_falha(
+                            engine, chunk_df, table_name, e, str(bloco_atual),
+                            quarentena, blocos_com_falha_persistente_primeira_rodada, prefixo_blocos
+                        )
+                        break
+
                     tentativas_chunk_atual += 1
-                    if '08S01' in str(e):
-                        logger.warning(f"  ⚠️ Falha de comunicação no bloco {bloco_atual}. Tentativa {tentativas_chunk_atual}/{retries_per_chunk}.")
+                    if _falha_transitoria(e):
+                        logger.warning(f"  ⚠️ Falha transitória ({_sqlstate(e) or '08S01'}) no bloco {bloco_atual}. Tentativa {tentativas_chunk_atual}/{retries_per_chunk}.")
                         if tentativas_chunk_atual < retries_per_chunk:
                             time.sleep(5)
-                        else:
-                            logger.error(f"  ❌ Bloco {bloco_atual} falhou após {retries_per_chunk} retentativas internas.")
-                            blocos_com_falha_persistente_primeira_rodada.append((bloco_atual, chunk_df))
-                            break 
-                    else:
+                            continue
+                        logger.error(f"  ❌ Bloco {bloco_atual} falhou após {retries_per_chunk} retentativas internas.")
+                    elif isinstance(e, pyodbc.OperationalError):
                         logger.error(f"  ❌ Erro operacional não recuperável no bloco {bloco_atual}.", exc_info=True)
                         raise e
-                except Exception as e: 
-                    logger.error(f"  ❌ Erro inesperado ao salvar bloco {bloco_atual}.", exc_info=True)
-                    # Adiciona à lista de falhas e sai do loop while para não tentar este chunk novamente
-                    blocos_com_falha_persistente_primeira_rodada.append((bloco_atual, chunk_df))
+                    else:
+                        logger.error(f"  ❌ Erro inesperado ao salvar bloco {bloco_atual}; ele será retentado na 2ª rodada.", exc_info=True)
+                    blocos_com_falha_persistente_primeira_rodada.guardar(
+                        f"{prefixo_blocos}{bloco_atual}", chunk_df, referencia=True
+                    )
                     break
 
-        if blocos_com_falha_persistente_primeira_rodada:
-            logger.warning(f"--- Iniciando 2ª RODADA para {len(blocos_com_falha_persistente_primeira_rodada)} blocos que falharam ---")
-            blocos_com_falha_final = []
+        chaves_segunda_rodada = blocos_com_falha_persistente_primeira_rodada.chaves(prefixo_blocos)
+        houve_retentativas = len(chaves_segunda_rodada) > 0
+        if houve_retentativas:
+            logger.warning(f"--- Iniciando 2ª RODADA para {len(chaves_segunda_rodada)} blocos que falharam ---")
             
-            for bloco_num, chunk_df_failed in blocos_com_falha_persistente_primeira_rodada:
+            for chave in chaves_segunda_rodada:
+                bloco_num = chave[len(prefixo_blocos):]
+                chunk_df_failed = blocos_com_falha_persistente_primeira_rodada.carregar(chave)
                 try:
                     with engine.begin() as connection:
                         logger.info(f"  -> 2ª Rodada: Retentando bloco {bloco_num}...")
-                        chunk_df_failed.to_sql(name=table_name, con=connection, if_exists='append', index=False)
+                        chunk_df_failed.to_sql(name=table_name, con=connection, if_exists='append', index=False, schema=esquema_padrao(engine))
+                    linhas_salvas += len(chunk_df_failed)
                     logger.info(f"  ✅ Sucesso na 2ª Rodada para o bloco {bloco_num}.")
                 except Exception as e:
-                    logger.error(f"  ❌ FALHA FINAL no bloco {bloco_num} mesmo após a 2ª Rodada.", exc_info=True)
-                    blocos_com_falha_final.append(bloco_num)
+                    if not _falha_de_dados(e):
+                        logger.error(f"  ❌ FALHA FINAL no bloco {bloco_num} mesmo após a 2ª Rodada.", exc_info=True)
+                        blocos_com_falha_final.append(bloco_num)
+                    else:
+                        logger.error(f"  ❌ Erro de dados no bloco {bloco_num} na 2ª Rodada; isolando as linhas com problema...")
+                        linhas_salvas += _isolar_linhas_com_falha(
+                            engine, chunk_df_failed, table_name, e, bloco_num, quarentena,
+                            blocos_com_falha_persistente_primeira_rodada, prefixo_segunda_rodada
+                        )
+                        # Só as partes deste bloco (as chaves são "<bloco> (linhas i-j)").
+                        for pendente in blocos_com_falha_persistente_primeira_rodada.chaves(
+                            f"{prefixo_segunda_rodada}{bloco_num} "
+                        ):
+                            blocos_com_falha_final.append(pendente[len(prefixo_segunda_rodada):])
+                            blocos_com_falha_persistente_primeira_rodada.remover(pendente)
+                finally:
+                    # Libera o bloco assim que ele é processado.
+                    blocos_com_falha_persistente_primeira_rodada.remover(chave)
+                    del chunk_df_failed
 
             if blocos_com_falha_final:
                 raise RuntimeError(f"Não foi possível salvar os seguintes blocos: {blocos_com_falha_final}")
 
+        linhas_quarentena = _gravar_quarentena(engine, table_name, quarentena) if quarentena else 0
+
         fim_total = time.perf_counter()
         tempo_total = fim_total - inicio_total
         
-        if not blocos_com_falha_persistente_primeira_rodada:
+        if linhas_quarentena:
+             logger.warning(f"⚠️ {linhas_salvas} de {total_rows} linhas salvas em {tempo_total:.2f} segundos; {linhas_quarentena} em quarentena.")
+        elif not houve_retentativas:
              logger.info(f"🎉 Sucesso! Todos os {total_rows} foram salvos em {tempo_total:.2f} segundos.")
-        elif not blocos_com_falha_final:
+        else:
              logger.info(f"🎉 Sucesso total! Todos os {total_rows} foram salvos, com retentativas, em {tempo_total:.2f} segundos.")
 
+        return {"linhas_salvas": linhas_salvas, "linhas_quarentena": linhas_quarentena}
+
     except Exception as e:
         logger.error(f"❌ O processo de salvamento falhou. Causa: {e}", exc_info=True)
         raise e
     finally:
+        # O buffer é do processo: remove apenas as entradas desta tabela.
+        for chave in blocos_com_falha_persistente_primeira_rodada.chaves(prefixo_blocos):
+            blocos_com_falha_persistente_primeira_rodada.remover(chave)
         if engine:
-            engine.dispose()
+            liberar_engine(engine)
@@ -0,0 +1,179 @@
+# impressao_digital.py
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import text
+
+from consultas_definidas import consultas
+from funcoes_globais import funcao_conexao, liberar_engine
+
+logger = logging.getLogger("logger_financa")
+
+PASTA_ESTADO = "estado"
+
+# Coluna de auditoria do TOTVS RM com a data da última alteração do registro.
+COLUNA_MODIFICACAO = "RECMODIFIEDON"
+
+# Agregados baratos sobre as tabelas de origem da consulta. As consultas com ANO/MES geram uma
+# impressão por período (lançamentos e o que eles alcançam); as demais, uma impressão da tabela
+# inteira (plano de contas e centros de custo, que valem para todos os períodos).
+FONTES_IMPRESSAO: Dict[str, Dict[str, str]] = {
+    "FatoFechamento": {
+        "CLANCA": f"""
+            SELECT YEAR(cln.[DATA]) AS ANO, MONTH(cln.[DATA]) AS MES,
+                   COUNT_BIG(*) AS QTD,
+                   CHECKSUM_AGG(BINARY_CHECKSUM(cln.LCTREF, cln.IDPARTIDA, cln.DEBITO, cln.CREDITO, cln.VALOR,
+                                                cln.CODHISTP, cln.INTEGRACHAVE, cln.COMPLEMENTO, cln.[DATA])) AS CHECKSUM,
+                   MAX(cln.{COLUNA_MODIFICACAO}) AS ULTIMA_ALTERACAO
+            FROM HUBDADOS.CorporeRM.CLANCA cln
+            WHERE YEAR(cln.[DATA]) >= 2022
+            GROUP BY YEAR(cln.[DATA]), MONTH(cln.[DATA])
+        """,
+        "CRATEIOLC": f"""
+            SELECT YEAR(cln.[DATA]) AS ANO, MONTH(cln.[DATA]) AS MES,
+                   COUNT_BIG(*) AS QTD,
+                   CHECKSUM_AGG(BINARY_CHECKSUM(crt.LCTREF, crt.IDPARTIDA, crt.CODCONTA, crt.CODGERENCIAL,
+                                                crt.VLRDEBITO, crt.VLRCREDITO, crt.IDRATEIO)) AS CHECKSUM,
+                   MAX(crt.{COLUNA_MODIFICACAO}) AS ULTIMA_ALTERACAO
+            FROM HUBDADOS.CorporeRM.CRATEIOLC crt
+            INNER JOIN HUBDADOS.CorporeRM.CLANCA cln ON cln.LCTREF = crt.LCTREF AND cln.IDPARTIDA = crt.IDPARTIDA
+            WHERE YEAR(cln.[DATA]) >= 2022
+            GROUP BY YEAR(cln.[DATA]), MONTH(cln.[DATA])
+        """,
+        # Movimentos e fornecedores entram só quando alcançados por um lançamento dos períodos carregados
+        # (via CLANCA.INTEGRACHAVE, como na consulta). O DISTINCT evita que o mesmo registro, referenciado
+        # por vários lançamentos do período, entre repetido no CHECKSUM_AGG (e se anule aos pares).
+        "TMOV": """
+            SELECT ref.ANO, ref.MES,
+                   COUNT_BIG(*) AS QTD,
+                   CHECKSUM_AGG(BINARY_CHECKSUM(tmv.IDMOV, tmv.CODTMV, tmv.CAMPOLIVRE1, tmv.CODUSUARIO,
+                                                tmv.DATAEMISSAO, tmv.CODCFO)) AS CHECKSUM
+            FROM (
+                SELECT DISTINCT YEAR(cln.[DATA]) AS ANO, MONTH(cln.[DATA]) AS MES, cln.INTEGRACHAVE
+                FROM HUBDADOS.CorporeRM.CLANCA cln
+                WHERE YEAR(cln.[DATA]) >= 2022
+            ) AS ref
+            INNER JOIN HUBDADOS.CorporeRM.TMOV tmv ON ref.INTEGRACHAVE = CAST(tmv.IDMOV AS VARCHAR(255))
+            GROUP BY ref.ANO, ref.MES
+        """,
+        "FCFO": """
+            SELECT ref.ANO, ref.MES,
+                   COUNT_BIG(*) AS QTD,
+                   CHECKSUM_AGG(BINARY_CHECKSUM(cfo.CODCFO, cfo.NOME)) AS CHECKSUM
+            FROM (
+                SELECT DISTINCT YEAR(cln.[DATA]) AS ANO, MONTH(cln.[DATA]) AS MES, tmv.CODCFO
+                FROM HUBDADOS.CorporeRM.CLANCA cln
+                INNER JOIN HUBDADOS.CorporeRM.TMOV tmv ON cln.INTEGRACHAVE = CAST(tmv.IDMOV AS VARCHAR(255))
+                WHERE YEAR(cln.[DATA]) >= 2022
+            ) AS ref
+            INNER JOIN HUBDADOS.CorporeRM.FCFO cfo ON cfo.CODCFO = ref.CODCFO
+            GROUP BY ref.ANO, ref.MES
+        """,
+        "CCONTA": """
+            SELECT COUNT_BIG(*) AS QTD,
+                   CHECKSUM_AGG(BINARY_CHECKSUM(CODCONTA, REDUZIDO, DESCRICAO, ANALITICA, NATUREZA)) AS CHECKSUM
+            FROM HUBDADOS.CorporeRM.CCONTA
+        """,
+        "GCCUSTO": """
+            SELECT COUNT_BIG(*) AS QTD, CHECKSUM_AGG(BINARY_CHECKSUM(CODCCUSTO, CAMPOLIVRE)) AS CHECKSUM
+            FROM HUBDADOS.CorporeRM.GCCUSTO
+        """,
+    },
+}
+
+# Chave usada para as impressões de tabela inteira.
+TABELA_INTEIRA = "*"
+
+
+def _caminho_estado(titulo: str, pasta: str) -> str:
+    return os.path.join(pasta, f"impressao_{titulo}.json")
+
+
+def _hash_definicao(titulo: str) -> str:
+    """Mudanças no SQL ou nos destinos da consulta também invalidam a impressão anterior."""
+    consulta = consultas[titulo]
+    definicao = json.dumps(
+        {"sql": consulta.sql, "destinos": consulta.destinos, "colunas": consulta.colunas,
+         "projecoes": consulta.projecoes},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(definicao.encode("utf-8")).hexdigest()
+
+
+def calcular_impressao_digital(titulo: str) -> Dict:
+    """Calcula a impressão digital das tabelas de origem (contagens, checksums e última alteração por período)."""
+    if titulo not in FONTES_IMPRESSAO:
+        raise ValueError(f"Não há fontes de impressão digital definidas para '{titulo}'.")
+
+    logger.info(f"🧬 Calculando a impressão digital das fontes de '{titulo}'...")
+    inicio = time.perf_counter()
+    fontes = {}
+    engine = None
+    try:
+        engine = funcao_conexao(consultas[titulo].conexao, finalidade="leitura")
+        with engine.connect() as connection:
+            for nome, sql in FONTES_IMPRESSAO[titulo].items():
+                resultado = pd.read_sql_query(text(sql), connection)
+                fontes[nome] = {
+                    (f"{int(linha.ANO):04d}-{int(linha.MES):02d}" if "ANO" in resultado.columns else TABELA_INTEIRA): [
+                        int(linha.QTD),
+                        None if pd.isna(linha.CHECKSUM) else int(linha.CHECKSUM),
+                        str(linha.ULTIMA_ALTERACAO) if "ULTIMA_ALTERACAO" in resultado.columns else None,
+                    ]
+                    for linha in resultado.itertuples(index=False)
+                }
+    finally:
+        if engine:
+            liberar_engine(engine)
+
+    logger.info(f"🧬 Impressão digital de '{titulo}' calculada em {time.perf_counter() - inicio:.2f} segundos.")
+    return {
+        "definicao": _hash_definicao(titulo),
+        "calculada_em": datetime.now().isoformat(timespec="seconds"),
+        "fontes": fontes,
+    }
+
+
+def carregar_impressao_digital(titulo: str, pasta: str = PASTA_ESTADO) -> Optional[Dict]:
+    """Impressão gravada após a última execução bem-sucedida (None se não houver)."""
+    caminho = _caminho_estado(titulo, pasta)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def salvar_impressao_digital(titulo: str, impressao: Dict, pasta: str = PASTA_ESTADO):
+    os.makedirs(pasta, exist_ok=True)
+    caminho = _caminho_estado(titulo, pasta)
+    with open(f"{caminho}.tmp", "w", encoding="utf-8") as f:
+        json.dump(impressao, f, ensure_ascii=False, indent=2)
+    os.replace(f"{caminho}.tmp", caminho)
+
+
+def periodos_alterados(anterior: Optional[Dict], atual: Dict) -> List[str]:
+    """
+    Lista os períodos 'AAAA-MM' cujas fontes mudaram. Retorna [TABELA_INTEIRA] quando a mudança
+    afeta todos os períodos (sem impressão anterior, definição alterada ou tabela de referência alterada).
+    Lista vazia significa que nada mudou desde a última execução bem-sucedida.
+    """
+    if anterior is None or anterior.get("definicao") != atual["definicao"]:
+        return [TABELA_INTEIRA]
+
+    alterados = set()
+    for nome, atual_fonte in atual["fontes"].items():
+        anterior_fonte = anterior["fontes"].get(nome)
+        if anterior_fonte is None:
+            return [TABELA_INTEIRA]
+        for chave in set(atual_fonte) | set(anterior_fonte):
+            if atual_fonte.get(chave) != anterior_fonte.get(chave):
+                if chave == TABELA_INTEIRA:
+                    return [TABELA_INTEIRA]
+                alterados.add(chave)
+    return sorted(alterados)
@@ -3,6 +3,7 @@
 import configura_mdx
 import logging
 import os
+import time
 from datetime import datetime
 
 # --- CONFIGURAÇÃO CENTRAL DE LOGGING ---
@@ -12,54 +13,178 @@ log_folder = "logs"
 if not os.path.exists(log_folder):
     os.makedirs(log_folder)
 
-data_str = datetime.now().strftime("%Y-%m-%d")
-log_file_path = os.path.join(log_folder, f"execucao_{data_str}.log")
+FORMATO_LOG = "%(asctime)s [%(levelname)s] - %(message)s"
+
+
+def _caminho_log_do_dia() -> str:
+    return os.path.join(log_folder, f"execucao_{datetime.now():%Y-%m-%d}.log")
+
+
+_handler_arquivo = logging.FileHandler(_caminho_log_do_dia(), encoding="utf-8")
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] - %(message)s",
+    format=FORMATO_LOG,
     handlers=[
-        logging.FileHandler(log_file_path, encoding="utf-8"),
+        _handler_arquivo,
         logging.StreamHandler()
     ],
     force=True  # Garante que esta configuração sobrescreva qualquer outra.
 )
 
+
+def _arquivo_de_log() -> logging.FileHandler:
+    """
+    Handler do arquivo de log do dia. No modo serviço o processo atravessa vários dias,
+    então o arquivo é trocado no início de cada execução quando a data muda.
+    """
+    global _handler_arquivo
+    caminho = os.path.abspath(_caminho_log_do_dia())
+    if _handler_arquivo.baseFilename != caminho:
+        raiz = logging.getLogger()
+        raiz.removeHandler(_handler_arquivo)
+        _handler_arquivo.close()
+        _handler_arquivo = logging.FileHandler(caminho, encoding="utf-8")
+        _handler_arquivo.setFormatter(logging.Formatter(FORMATO_LOG))
+        raiz.addHandler(_handler_arquivo)
+    return _handler_arquivo
+
 # Obtém a instância do logger que será usada em todo o projeto.
 logger = logging.getLogger("logger_financa")
 
 # --- Importações do projeto (após a configuração do log) ---
-from funcoes_globais import selecionar_consulta_por_nome, salvar_no_financa
-from notificacoes import enviar_email_status
+from funcoes_globais import selecionar_consulta_por_nome
+from buffer_disco import buffer_compartilhado
+from consultas_definidas import consultas
+from destinos import DestinoTabelaSQL, colunas_necessarias, criar_destinos, gravar_em_destinos
+from reconciliacao import reconciliar
+from impressao_digital import (
+    FONTES_IMPRESSAO, TABELA_INTEIRA, calcular_impressao_digital, carregar_impressao_digital,
+    periodos_alterados, salvar_impressao_digital
+)
+from notificacoes import ColetorErros, ResumoExecucao, despachante_compartilhado
+
+# Backend de notificação: "outlook" (somente Windows), "smtp" ou "arquivo".
+NOTIFICADOR = os.environ.get("NOTIFICADOR", "arquivo")
+
+# Captura SET STATISTICS IO/TIME da consulta de origem no histórico de desempenho.
+CAPTURAR_ESTATISTICAS = os.environ.get("CAPTURAR_ESTATISTICAS", "0") == "1"
 
-def main():
+# Também reconcilia com a consulta de origem agregada no servidor (reexecuta a consulta de origem,
+# mas só trafegam os grupos). Desligado por padrão pelo custo extra na origem.
+RECONCILIAR_ORIGEM = os.environ.get("RECONCILIAR_ORIGEM", "0") == "1"
+
+# Pula a execução quando as tabelas de origem não mudaram desde a última execução bem-sucedida.
+# Use VERIFICAR_ALTERACOES=0 para forçar a carga completa.
+VERIFICAR_ALTERACOES = os.environ.get("VERIFICAR_ALTERACOES", "1") == "1"
+
+def main(query: str = "FatoFechamento") -> str:
     """
     Função principal que orquestra a execução do script:
-    1. Executa a consulta para obter os dados.
-    2. Salva os dados no banco de dados.
-    3. Envia um e-mail com o status final e o log completo.
+    0. Compara a impressão digital das fontes com a da última execução e, sem alterações, encerra.
+    1. Executa a consulta para obter os dados, selecionando só as colunas que os destinos usam.
+    2. Grava o mesmo extrato em todos os destinos da consulta, em paralelo.
+    3. Reconcilia as tabelas SQL carregadas com o extrato (contagens e somas por grupo) e,
+       com RECONCILIAR_ORIGEM=1, também com a consulta de origem agregada no servidor.
+    4. Envia, em segundo plano, um resumo com o status final, as métricas,
+       os últimos erros e o trecho do log desta execução compactado em anexo.
+    Retorna o status final da execução.
     """
     status_final = "SUCESSO"
-    query = "FatoFechamento"
-    tabela_destino = "FatoFechamento_v2"
-    
+    metricas = {}
+    colunas_reconciliacao = {"DATA", "CONTA", "VALOR"}
+    impressao_atual = None
+    buffer = buffer_compartilhado()
+    chave_extrato = f"extrato/{query}"
+
+    # O anexo da notificação leva só o trecho do log escrito a partir daqui.
+    handler_log = _arquivo_de_log()
+    handler_log.flush()
+    inicio_log = os.path.getsize(handler_log.baseFilename)
+
+    coletor_erros = ColetorErros()
+    logging.getLogger().addHandler(coletor_erros)
+    inicio = time.perf_counter()
+
     try:
         logger.info(f"--- INÍCIO DA EXECUÇÃO DO SCRIPT: {query} ---")
+
+        # 0. Verificar se as fontes mudaram desde a última execução bem-sucedida
+        if VERIFICAR_ALTERACOES and query in FONTES_IMPRESSAO:
+            try:
+                impressao_atual = calcular_impressao_digital(query)
+                alterados = periodos_alterados(carregar_impressao_digital(query), impressao_atual)
+            except Exception as e:
+                # Na dúvida, executa a carga completa.
+                logger.warning(f"⚠️ Não foi possível verificar alterações nas fontes ({e}); seguindo com a carga completa.")
+                alterados = [TABELA_INTEIRA]
+
+            if not alterados:
+                status_final = "SEM ALTERAÇÕES"
+                logger.info(f"⏭️ Nenhuma alteração nas fontes de '{query}' desde a última execução. Carga ignorada.")
+                return status_final
+            metricas["Períodos alterados"] = "todos" if TABELA_INTEIRA in alterados else ", ".join(alterados)
+            logger.info(f"🧬 Períodos alterados desde a última execução: {metricas['Períodos alterados']}")
         
-        # 1. Obter os dados
-        df_fato_fechamento = selecionar_consulta_por_nome(query)
+        # 1. Obter os dados (apenas as colunas pedidas pelos destinos)
+        consulta = consultas[query]
+        destinos = criar_destinos(consulta)
+        colunas = colunas_necessarias(destinos, consulta.colunas)
+        if colunas:
+            logger.info(f"Projeção de colunas para '{query}': {colunas}")
+        df_fato_fechamento = selecionar_consulta_por_nome(
+            query, capturar_estatisticas=CAPTURAR_ESTATISTICAS, colunas=colunas
+        )
         
         if df_fato_fechamento.empty:
             # Esta exceção será levantada se a consulta falhar ou não retornar linhas.
             raise ValueError("A consulta não retornou dados. Verifique o log de erros para a causa raiz.")
             
+        metricas["Linhas extraídas"] = len(df_fato_fechamento)
         logger.info("Consulta executada com sucesso. Visualizando as primeiras linhas:")
         logger.info(f"\n{df_fato_fechamento.head().to_string()}")
         
-        # 2. Salvar os dados
-        logger.info(f"Iniciando o salvamento dos dados na tabela: {tabela_destino}...")
-        salvar_no_financa(df_fato_fechamento, tabela_destino)
+        # 2. Salvar os dados em todos os destinos a partir do mesmo extrato
+        resultados = gravar_em_destinos(df_fato_fechamento, destinos)
+
+        # Depois da gravação só a reconciliação usa o extrato, e apenas algumas colunas: elas vão
+        # para o buffer do processo (em disco, se excederem o orçamento) e o extrato é liberado.
+        # Só tabelas de detalhe que contêm as colunas usadas na reconciliação são reconciliadas.
+        destinos_reconciliacao = [
+            destino for destino in destinos
+            if type(destino) is DestinoTabelaSQL
+            and colunas_reconciliacao.issubset(destino.colunas or df_fato_fechamento.columns)
+        ]
+        if destinos_reconciliacao:
+            buffer.guardar(chave_extrato, df_fato_fechamento[sorted(colunas_reconciliacao)])
+        del df_fato_fechamento
+        for nome_destino, resultado in resultados.items():
+            metricas[f"Destino {nome_destino}"] = f"{resultado['status']} ({resultado['tempo']:.2f}s)"
+            if resultado["detalhes"].get("linhas_quarentena"):
+                metricas[f"Quarentena {nome_destino}"] = f"{resultado['detalhes']['linhas_quarentena']} linhas"
+                status_final = "SUCESSO COM QUARENTENA"
+
+        destinos_com_falha = [nome for nome, resultado in resultados.items() if resultado["status"] != "SUCESSO"]
+        if destinos_com_falha:
+            raise RuntimeError(f"Os seguintes destinos falharam: {destinos_com_falha}")
+
+        # 3. Reconciliar as tabelas carregadas com agregados calculados no servidor
+        df_reconciliacao = buffer.carregar(chave_extrato) if destinos_reconciliacao else None
+        for destino in destinos_reconciliacao:
+            divergencias = reconciliar(
+                destino.tabela, df=df_reconciliacao, titulo=query if RECONCILIAR_ORIGEM else None,
+                conexao=destino.conexao
+            )
+            metricas[f"Reconciliação {destino.tabela}"] = (
+                "OK" if divergencias.empty else f"{len(divergencias)} grupos divergentes"
+            )
+            if not divergencias.empty:
+                status_final = "DIVERGÊNCIA"
         
+        # Só uma carga totalmente bem-sucedida registra a impressão; caso contrário a próxima execução refaz a carga.
+        if impressao_atual and status_final == "SUCESSO":
+            salvar_impressao_digital(query, impressao_atual)
+
         logger.info(f"--- PROCESSO FINALIZADO COM SUCESSO ---")
         
     except Exception as e:
@@ -68,24 +193,33 @@ def main():
         logger.error(f"A execução principal falhou catastroficamente: {e}", exc_info=True)
         
     finally:
-        logger.info("Preparando notificação por e-mail...")
-        log_content = ""
+        metricas["Tempo total"] = f"{time.perf_counter() - inicio:.2f} segundos"
+        buffer.remover(chave_extrato)
+        logging.getLogger().removeHandler(coletor_erros)
+
+        # Garante que o buffer de log seja escrito no arquivo antes de compactá-lo.
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+
+        resumo = ResumoExecucao(
+            titulo=query,
+            status=status_final,
+            metricas=metricas,
+            erros=list(coletor_erros.erros),
+            total_erros=coletor_erros.total,
+            caminho_log=handler_log.baseFilename,
+            inicio_log=inicio_log,
+        )
+
         try:
-            # Garante que o buffer de log seja escrito no arquivo antes de lê-lo.
-            for handler in logging.getLogger().handlers:
-                handler.flush()
-            
-            with open(log_file_path, 'r', encoding='utf-8') as f:
-                log_content = f.read()
-            logger.info(f"Arquivo de log '{log_file_path}' lido com sucesso.")
-        except Exception as log_e:
-            log_content = f"FALHA AO LER O ARQUIVO DE LOG.\nErro: {log_e}"
-            logger.error(log_content)
-            
-        # O restante da sua lógica de envio de e-mail permanece aqui...
-        assunto = f"Relatório de Execução do Script FatoFechamento - {status_final}"
-        # enviar_email_status(subject=assunto, body=log_content)
-        logger.info(f"Simulação: E-mail de status '{status_final}' enviado.")
+            # O despachante é do processo: no modo serviço ele atravessa as execuções, e na linha de
+            # comando o envio pendente é aguardado só na saída do processo.
+            despachante_compartilhado(NOTIFICADOR).despachar(resumo)
+            logger.info(f"Notificação de status '{status_final}' enfileirada ({NOTIFICADOR}).")
+        except Exception as notif_e:
+            logger.error(f"Falha ao preparar a notificação: {notif_e}")
+
+    return status_final
 
 
 if __name__ == "__main__":
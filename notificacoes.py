@@ -1,31 +1,298 @@
-import win32com.client as win32
+import atexit
+import gzip
+import logging
 import os
+import queue
+import shutil
+import smtplib
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("logger_financa")
 
 # O e-mail será enviado para o destinatário especificado abaixo
 RECIPIENT_EMAIL = "cesargl@sebraesp.com.br"
 
-def enviar_email_status(subject: str, body: str):
+# Configuração do backend SMTP (pode ser sobrescrita por variáveis de ambiente)
+SMTP_SERVIDOR = os.environ.get("SMTP_SERVIDOR", "localhost")
+SMTP_PORTA = int(os.environ.get("SMTP_PORTA", "25"))
+SMTP_REMETENTE = os.environ.get("SMTP_REMETENTE", "fatofechamento@sebraesp.com.br")
+
+# Limites do resumo enviado na notificação
+MAX_ERROS_RESUMO = 20
+TIMEOUT_NOTIFICACAO_SEGUNDOS = 30
+
+
+class ColetorErros(logging.Handler):
+    """
+    Handler de logging que guarda apenas as últimas N mensagens de erro.
+    Evita reler o arquivo de log inteiro ao final da execução.
+    """
+
+    def __init__(self, max_erros: int = MAX_ERROS_RESUMO):
+        super().__init__(level=logging.ERROR)
+        self.erros = deque(maxlen=max_erros)
+        self.total = 0
+
+    def emit(self, record: logging.LogRecord):
+        self.total += 1
+        self.erros.append(f"{datetime.fromtimestamp(record.created):%H:%M:%S} - {record.getMessage()}")
+
+
+class ResumoExecucao:
+    """
+    Conteúdo limitado da notificação: status, métricas, últimos erros e anexo do log.
+    O anexo leva o log a partir do byte `inicio_log` (o trecho da execução, não o arquivo inteiro)
+    e tem nome próprio da execução, para que execuções seguidas ou simultâneas não se sobrescrevam.
+    """
+
+    def __init__(self, titulo: str, status: str, metricas: Optional[Dict] = None,
+                 erros: Optional[List[str]] = None, total_erros: int = 0,
+                 caminho_log: Optional[str] = None, inicio_log: int = 0):
+        self.titulo = titulo
+        self.status = status
+        self.metricas = metricas or {}
+        self.erros = erros or []
+        self.total_erros = total_erros
+        self.caminho_log = caminho_log
+        self.inicio_log = inicio_log
+        self.instante = datetime.now()
+
+    @property
+    def nome_anexo(self) -> Optional[str]:
+        if not self.caminho_log:
+            return None
+        base = os.path.splitext(os.path.basename(self.caminho_log))[0]
+        return f"{base}_{self.titulo}_{self.instante:%H%M%S_%f}.log.gz"
+
+    @property
+    def assunto(self) -> str:
+        return f"Relatório de Execução do Script {self.titulo} - {self.status}"
+
+    def corpo(self) -> str:
+        linhas = [f"Status: {self.status}", ""]
+        if self.metricas:
+            linhas.append("Métricas:")
+            linhas.extend(f"  - {chave}: {valor}" for chave, valor in self.metricas.items())
+            linhas.append("")
+        if self.erros:
+            linhas.append(f"Últimos {len(self.erros)} de {self.total_erros} erros:")
+            linhas.extend(f"  {erro}" for erro in self.erros)
+        else:
+            linhas.append("Nenhum erro registrado.")
+        if self.caminho_log:
+            linhas.extend(["", f"Log da execução (compactado) em anexo: {self.nome_anexo}"])
+        return "\n".join(linhas)
+
+
+def compactar_log(caminho_log: str, caminho_gz: str, inicio: int = 0) -> Optional[str]:
+    """
+    Compacta o arquivo de log a partir do byte `inicio` em `caminho_gz`, em streaming
+    (sem carregá-lo na memória), e retorna o caminho do .gz.
+    """
+    if not caminho_log or not os.path.exists(caminho_log):
+        return None
+    with open(caminho_log, "rb") as origem, gzip.open(caminho_gz, "wb") as destino:
+        origem.seek(inicio)
+        shutil.copyfileobj(origem, destino)
+    return caminho_gz
+
+
+@contextmanager
+def _anexo_temporario(resumo: ResumoExecucao):
+    """Log da execução compactado numa pasta temporária, apagada depois do envio."""
+    if not resumo.caminho_log:
+        yield None
+        return
+    pasta = tempfile.mkdtemp(prefix="notificacao_")
+    try:
+        yield compactar_log(resumo.caminho_log, os.path.join(pasta, resumo.nome_anexo), resumo.inicio_log)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+class Notificador:
+    """Interface dos backends de notificação."""
+
+    def enviar(self, resumo: ResumoExecucao):
+        raise NotImplementedError
+
+
+class NotificadorOutlook(Notificador):
     """
     Envia um e-mail usando o cliente Outlook local, aproveitando a autenticação do Windows.
     Não requer senha no código.
     """
+
+    def __init__(self, destinatario: str = RECIPIENT_EMAIL):
+        self.destinatario = destinatario
+
+    def enviar(self, resumo: ResumoExecucao):
+        import pythoncom
+        import win32com.client as win32
+
+        # O envio roda na thread do despachante, que precisa inicializar o COM por conta própria.
+        pythoncom.CoInitialize()
+        try:
+            outlook = win32.Dispatch('outlook.application')
+            mail = outlook.CreateItem(0)
+            mail.To = self.destinatario
+            mail.Subject = resumo.assunto
+            mail.Body = resumo.corpo()
+
+            with _anexo_temporario(resumo) as anexo:
+                if anexo:
+                    mail.Attachments.Add(os.path.abspath(anexo))
+                mail.Send()
+        finally:
+            pythoncom.CoUninitialize()
+
+
+class NotificadorSMTP(Notificador):
+    """Envia o resumo por SMTP, com o log compactado como anexo."""
+
+    def __init__(self, servidor: str = SMTP_SERVIDOR, porta: int = SMTP_PORTA,
+                 remetente: str = SMTP_REMETENTE, destinatario: str = RECIPIENT_EMAIL,
+                 timeout: int = TIMEOUT_NOTIFICACAO_SEGUNDOS):
+        self.servidor = servidor
+        self.porta = porta
+        self.remetente = remetente
+        self.destinatario = destinatario
+        self.timeout = timeout
+
+    def enviar(self, resumo: ResumoExecucao):
+        mensagem = EmailMessage()
+        mensagem["From"] = self.remetente
+        mensagem["To"] = self.destinatario
+        mensagem["Subject"] = resumo.assunto
+        mensagem.set_content(resumo.corpo())
+
+        with _anexo_temporario(resumo) as anexo:
+            if anexo:
+                with open(anexo, "rb") as f:
+                    mensagem.add_attachment(f.read(), maintype="application", subtype="gzip",
+                                            filename=os.path.basename(anexo))
+
+        with smtplib.SMTP(self.servidor, self.porta, timeout=self.timeout) as smtp:
+            smtp.send_message(mensagem)
+
+
+class NotificadorArquivo(Notificador):
+    """
+    Grava o resumo em um arquivo texto na pasta indicada (útil fora do Windows e em testes),
+    com o log compactado da execução ao lado.
+    """
+
+    def __init__(self, pasta: str = "logs"):
+        self.pasta = pasta
+
+    def enviar(self, resumo: ResumoExecucao):
+        os.makedirs(self.pasta, exist_ok=True)
+        nome = f"notificacao_{resumo.instante:%Y-%m-%d_%H%M%S_%f}.txt"
+        with open(os.path.join(self.pasta, nome), "w", encoding="utf-8") as f:
+            f.write(f"{resumo.assunto}\n\n{resumo.corpo()}\n")
+        if resumo.caminho_log:
+            compactar_log(resumo.caminho_log, os.path.join(self.pasta, resumo.nome_anexo), resumo.inicio_log)
+
+
+NOTIFICADORES = {
+    "outlook": NotificadorOutlook,
+    "smtp": NotificadorSMTP,
+    "arquivo": NotificadorArquivo,
+}
+
+
+def criar_notificador(nome: str) -> Notificador:
+    """Instancia o backend de notificação pelo nome ('outlook', 'smtp' ou 'arquivo')."""
+    if nome not in NOTIFICADORES:
+        raise ValueError(f"Notificador '{nome}' não suportado. Opções: {list(NOTIFICADORES)}")
+    return NOTIFICADORES[nome]()
+
+
+class DespachanteNotificacoes:
+    """
+    Envia notificações em uma thread de fundo, fora do caminho crítico do pipeline.
+    O chamador apenas enfileira o resumo; falhas do backend são registradas no log e nunca propagadas.
+    """
+
+    def __init__(self, notificador: Notificador, timeout: int = TIMEOUT_NOTIFICACAO_SEGUNDOS):
+        self.notificador = notificador
+        self.timeout = timeout
+        self._fila = queue.Queue()
+        self._thread = threading.Thread(target=self._processar, name="despachante-notificacoes", daemon=True)
+        self._thread.start()
+
+    def _processar(self):
+        while True:
+            resumo = self._fila.get()
+            try:
+                if resumo is None:
+                    return
+                self.notificador.enviar(resumo)
+                logger.info(f"📧 Notificação '{resumo.status}' enviada via {type(self.notificador).__name__}.")
+            except Exception as e:
+                logger.error(f"❌ Falha ao enviar notificação via {type(self.notificador).__name__}: {e}")
+            finally:
+                self._fila.task_done()
+
+    def despachar(self, resumo: ResumoExecucao):
+        """Enfileira o resumo e retorna imediatamente."""
+        self._fila.put(resumo)
+
+    def encerrar(self, timeout: Optional[float] = None):
+        """Aguarda o envio pendente por até `timeout` segundos; depois disso a thread é abandonada."""
+        self._fila.put(None)
+        self._thread.join(self.timeout if timeout is None else timeout)
+        if self._thread.is_alive():
+            logger.warning(f"⚠️ Notificação não concluída em {self.timeout}s; seguindo sem aguardar.")
+
+
+_despachante_compartilhado: Optional[DespachanteNotificacoes] = None
+_lock_despachante = threading.Lock()
+
+
+def despachante_compartilhado(nome_notificador: str) -> DespachanteNotificacoes:
+    """
+    Despachante único do processo, criado na primeira notificação. As execuções só enfileiram;
+    o envio pendente é aguardado (até o timeout) apenas no encerramento do processo.
+    """
+    global _despachante_compartilhado
+    with _lock_despachante:
+        if _despachante_compartilhado is None:
+            _despachante_compartilhado = DespachanteNotificacoes(criar_notificador(nome_notificador))
+            atexit.register(_despachante_compartilhado.encerrar)
+        return _despachante_compartilhado
+
+
+def enviar_email_status(subject: str, body: str):
+    """
+    Envia um e-mail usando o cliente Outlook local, aproveitando a autenticação do Windows.
+    Mantida por compatibilidade; prefira `DespachanteNotificacoes` com `ResumoExecucao`.
+    """
     try:
+        import win32com.client as win32
+
         print(f"Tentando enviar e-mail para '{RECIPIENT_EMAIL}' via Outlook...")
-        
+
         # Conecta-se ao aplicativo Outlook
         outlook = win32.Dispatch('outlook.application')
-        
+
         # Cria um novo item de e-mail
         mail = outlook.CreateItem(0)
-        
+
         # Define os campos do e-mail
         mail.To = RECIPIENT_EMAIL
         mail.Subject = subject
         mail.Body = body
-        
+
         # Envia o e-mail
         mail.Send()
-        
+
         print(f"SUCESSO: E-mail de status enviado para {RECIPIENT_EMAIL} através do Outlook.")
 
     except Exception as e:
@@ -37,4 +304,3 @@ def enviar_email_status(subject: str, body: str):
         print("3. O Outlook exibiu um aviso de segurança que precisa ser aceito manualmente.")
         print(f"Detalhes do erro: {e}")
         print("="*50 + "\n")
-
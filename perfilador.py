@@ -0,0 +1,151 @@
+# perfilador.py
+import logging
+import os
+import re
+import sqlite3
+import statistics
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger("logger_financa")
+
+CAMINHO_HISTORICO = os.path.join("logs", "historico_consultas.db")
+
+FASES = ["execucao_servidor", "primeira_linha", "transferencia", "construcao_dataframe"]
+
+# Regressão: fase mais lenta que FATOR_REGRESSAO x a mediana das últimas JANELA_BASE execuções.
+JANELA_BASE = 10
+FATOR_REGRESSAO = 1.5
+# Fases abaixo deste tempo não são sinalizadas (ruído).
+MINIMO_SEGUNDOS_REGRESSAO = 5.0
+
+
+class PerfilConsulta:
+    """Tempos por fase de uma execução de consulta e, opcionalmente, as estatísticas do servidor."""
+
+    def __init__(self):
+        self.fases: Dict[str, float] = {fase: 0.0 for fase in FASES}
+        self.linhas = 0
+        self.mensagens_servidor: List[str] = []
+
+    @property
+    def total(self) -> float:
+        return sum(self.fases.values())
+
+    def estatisticas_servidor(self) -> Dict[str, int]:
+        """Extrai das mensagens de SET STATISTICS IO/TIME os totais de leituras e tempos do servidor (ms)."""
+        texto = "\n".join(self.mensagens_servidor)
+        return {
+            "leituras_logicas": sum(int(v) for v in re.findall(r"logical reads (\d+)", texto)),
+            "leituras_fisicas": sum(int(v) for v in re.findall(r"physical reads (\d+)", texto)),
+            "cpu_servidor_ms": sum(int(v) for v in re.findall(r"CPU time = (\d+) ms", texto)),
+            "decorrido_servidor_ms": sum(int(v) for v in re.findall(r"elapsed time = (\d+) ms", texto)),
+        }
+
+    def resumo(self) -> str:
+        partes = [f"{fase}={tempo:.2f}s" for fase, tempo in self.fases.items()]
+        return f"{self.linhas} linhas em {self.total:.2f}s (" + ", ".join(partes) + ")"
+
+
+def _abrir_historico(caminho: str) -> sqlite3.Connection:
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    conexao = sqlite3.connect(caminho)
+    conexao.execute(
+        """
+        CREATE TABLE IF NOT EXISTS execucoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            consulta TEXT NOT NULL,
+            executado_em TEXT NOT NULL,
+            linhas INTEGER,
+            execucao_servidor REAL,
+            primeira_linha REAL,
+            transferencia REAL,
+            construcao_dataframe REAL,
+            total REAL,
+            leituras_logicas INTEGER,
+            leituras_fisicas INTEGER,
+            cpu_servidor_ms INTEGER,
+            decorrido_servidor_ms INTEGER
+        )
+        """
+    )
+    return conexao
+
+
+def registrar_perfil(titulo: str, perfil: PerfilConsulta, caminho: str = CAMINHO_HISTORICO):
+    """Grava a execução no histórico local (SQLite)."""
+    estatisticas = perfil.estatisticas_servidor() if perfil.mensagens_servidor else {}
+    with _abrir_historico(caminho) as conexao:
+        conexao.execute(
+            """
+            INSERT INTO execucoes (consulta, executado_em, linhas, execucao_servidor, primeira_linha,
+                transferencia, construcao_dataframe, total, leituras_logicas, leituras_fisicas,
+                cpu_servidor_ms, decorrido_servidor_ms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                titulo, datetime.now().isoformat(timespec="seconds"), perfil.linhas,
+                *(perfil.fases[fase] for fase in FASES), perfil.total,
+                estatisticas.get("leituras_logicas"), estatisticas.get("leituras_fisicas"),
+                estatisticas.get("cpu_servidor_ms"), estatisticas.get("decorrido_servidor_ms"),
+            ),
+        )
+    conexao.close()
+
+
+def carregar_historico(titulo: Optional[str] = None, caminho: str = CAMINHO_HISTORICO) -> pd.DataFrame:
+    """Retorna o histórico de execuções (de uma consulta ou de todas), da mais antiga para a mais recente."""
+    conexao = _abrir_historico(caminho)
+    try:
+        if titulo:
+            return pd.read_sql_query("SELECT * FROM execucoes WHERE consulta = ? ORDER BY id", conexao, params=(titulo,))
+        return pd.read_sql_query("SELECT * FROM execucoes ORDER BY id", conexao)
+    finally:
+        conexao.close()
+
+
+def detectar_regressoes(
+    titulo: str, janela: int = JANELA_BASE, fator: float = FATOR_REGRESSAO, caminho: str = CAMINHO_HISTORICO
+) -> List[str]:
+    """Compara a última execução com a mediana das `janela` anteriores e lista as fases que regrediram."""
+    historico = carregar_historico(titulo, caminho)
+    if len(historico) < 2:
+        return []
+
+    ultima = historico.iloc[-1]
+    base = historico.iloc[-(janela + 1):-1]
+    regressoes = []
+    for fase in FASES + ["total", "leituras_logicas"]:
+        valores = base[fase].dropna().tolist()
+        if not valores or pd.isna(ultima[fase]):
+            continue
+        mediana = statistics.median(valores)
+        if fase != "leituras_logicas" and ultima[fase] < MINIMO_SEGUNDOS_REGRESSAO:
+            continue
+        if mediana > 0 and ultima[fase] > fator * mediana:
+            regressoes.append(f"{fase}: {ultima[fase]:.2f} vs mediana {mediana:.2f} ({ultima[fase] / mediana:.1f}x)")
+    return regressoes
+
+
+def relatorio(janela: int = JANELA_BASE, fator: float = FATOR_REGRESSAO, caminho: str = CAMINHO_HISTORICO) -> str:
+    """Relatório textual com a última execução de cada consulta e as regressões detectadas."""
+    historico = carregar_historico(caminho=caminho)
+    if historico.empty:
+        return "Nenhuma execução registrada."
+
+    linhas = []
+    for titulo, execucoes in historico.groupby("consulta", sort=True):
+        ultima = execucoes.iloc[-1]
+        fases = ", ".join(f"{fase}={ultima[fase]:.2f}s" for fase in FASES)
+        linhas.append(f"{titulo} ({ultima['executado_em']}, {int(ultima['linhas'])} linhas): {fases}")
+        for regressao in detectar_regressoes(titulo, janela, fator, caminho):
+            linhas.append(f"  ⚠️ REGRESSÃO {regressao}")
+    return "\n".join(linhas)
+
+
+if __name__ == "__main__":
+    print(relatorio())
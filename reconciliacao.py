@@ -0,0 +1,136 @@
+# reconciliacao.py
+import logging
+import time
+from typing import Optional
+
+import pandas as pd
+from sqlalchemy import text
+
+from consultas_definidas import consultas
+from funcoes_globais import funcao_conexao, liberar_engine, tabela_qualificada
+from utils import envolver_consulta
+
+logger = logging.getLogger("logger_financa")
+
+DIMENSOES = ["ANO", "MES", "CONTA"]
+
+# Agregado calculado no servidor: apenas alguns milhares de grupos trafegam pela rede.
+SQL_AGREGADO = """
+SELECT
+    YEAR([DATA]) AS ANO,
+    MONTH([DATA]) AS MES,
+    CONTA,
+    COUNT_BIG(*) AS QTD_LINHAS,
+    SUM(CAST(VALOR AS DECIMAL(38, 4))) AS VALOR
+FROM {origem}
+GROUP BY YEAR([DATA]), MONTH([DATA]), CONTA
+"""
+
+
+def _normalizar(agregado: pd.DataFrame) -> pd.DataFrame:
+    agregado = agregado.copy()
+    agregado["ANO"] = agregado["ANO"].astype("Int64")
+    agregado["MES"] = agregado["MES"].astype("Int64")
+    agregado["QTD_LINHAS"] = agregado["QTD_LINHAS"].astype("int64")
+    agregado["VALOR"] = agregado["VALOR"].astype("float64")
+    return agregado
+
+
+def _agregar_no_servidor(
+    sql: str, conexao: str, finalidade: str = "escrita", tabela: Optional[str] = None
+) -> pd.DataFrame:
+    """Executa o agregado; com `tabela`, `{origem}` é preenchido com o nome qualificado para o banco da engine."""
+    engine = None
+    try:
+        engine = funcao_conexao(conexao, finalidade=finalidade)
+        if tabela is not None:
+            sql = sql.format(origem=tabela_qualificada(engine, tabela))
+        with engine.connect() as connection:
+            return _normalizar(pd.read_sql_query(text(sql), connection))
+    finally:
+        if engine:
+            liberar_engine(engine)
+
+
+def agregar_tabela(tabela: str, conexao: str = "SPSVSQL39") -> pd.DataFrame:
+    """
+    Agrega a tabela carregada no próprio servidor, sem trazer as linhas para o Python.
+    Lê do primário, pois uma réplica pode ainda não ter recebido a carga.
+    """
+    return _agregar_no_servidor(SQL_AGREGADO, conexao, tabela=tabela)
+
+
+def agregar_consulta(titulo: str) -> pd.DataFrame:
+    """Agrega o resultado da consulta de origem no servidor (reexecuta a consulta, mas só devolve os grupos)."""
+    consulta = consultas[titulo]
+    return _agregar_no_servidor(
+        envolver_consulta(consulta.sql, SQL_AGREGADO.format(origem="__fonte")), consulta.conexao, finalidade="leitura"
+    )
+
+
+def agregar_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Agregado vetorizado do extrato em memória, nos mesmos grupos do agregado do servidor."""
+    data = pd.to_datetime(df["DATA"])
+    agregado = (
+        df.groupby([data.dt.year.rename("ANO"), data.dt.month.rename("MES"), df["CONTA"]], dropna=False, sort=False)["VALOR"]
+        .agg(QTD_LINHAS="size", VALOR="sum")
+        .reset_index()
+    )
+    return _normalizar(agregado)
+
+
+def comparar_agregados(
+    esperado: pd.DataFrame, obtido: pd.DataFrame, tolerancia: float = 0.01
+) -> pd.DataFrame:
+    """Retorna apenas os grupos cuja contagem ou soma de VALOR diverge entre os dois agregados."""
+    comparacao = esperado.merge(obtido, on=DIMENSOES, how="outer", suffixes=("_ESPERADO", "_OBTIDO"))
+    colunas_metricas = [c for c in comparacao.columns if c not in DIMENSOES]
+    comparacao[colunas_metricas] = comparacao[colunas_metricas].fillna(0)
+
+    divergente = (comparacao["QTD_LINHAS_ESPERADO"] != comparacao["QTD_LINHAS_OBTIDO"]) | (
+        (comparacao["VALOR_ESPERADO"] - comparacao["VALOR_OBTIDO"]).abs() > tolerancia
+    )
+    return comparacao[divergente].reset_index(drop=True)
+
+
+def reconciliar(
+    tabela: str,
+    df: Optional[pd.DataFrame] = None,
+    titulo: Optional[str] = None,
+    conexao: str = "SPSVSQL39",
+    tolerancia: float = 0.01,
+) -> pd.DataFrame:
+    """
+    Compara contagens e SUM(VALOR) por ano/mês/CONTA entre a origem e a tabela carregada.
+    A origem pode ser o extrato em memória (`df`, sem custo no servidor) e/ou a consulta de
+    origem agregada no servidor (`titulo`, que reexecuta a consulta mas só devolve os grupos).
+    Retorna os grupos divergentes, com a coluna REFERENCIA indicando a comparação.
+    """
+    if df is None and titulo is None:
+        raise ValueError("Informe o extrato (df) e/ou o título da consulta de origem.")
+
+    logger.info(f"🔎 Reconciliando '{tabela}' com a origem...")
+    inicio = time.perf_counter()
+
+    obtido = agregar_tabela(tabela, conexao)
+    referencias = []
+    if df is not None:
+        referencias.append(("extrato", "o extrato", agregar_dataframe(df)))
+    if titulo is not None:
+        referencias.append(("consulta", "a consulta de origem", agregar_consulta(titulo)))
+
+    resultados = []
+    for nome, descricao, esperado in referencias:
+        divergencias = comparar_agregados(esperado, obtido, tolerancia)
+        divergencias.insert(0, "REFERENCIA", nome)
+        resultados.append(divergencias)
+        if divergencias.empty:
+            logger.info(f"✅ Reconciliação de '{tabela}' com {descricao} OK: {len(esperado)} grupos conferidos.")
+        else:
+            logger.error(
+                f"❌ Reconciliação de '{tabela}' com {descricao} encontrou {len(divergencias)} grupos divergentes "
+                f"(de {len(esperado)}):\n{divergencias.head(20).to_string()}"
+            )
+
+    logger.info(f"🔎 Reconciliação de '{tabela}' finalizada em {time.perf_counter() - inicio:.2f} segundos.")
+    return pd.concat(resultados, ignore_index=True)
@@ -0,0 +1,40 @@
+# resumos.py
+import logging
+from typing import List
+
+import pandas as pd
+
+logger = logging.getLogger("logger_financa")
+
+# Dimensões derivadas da coluna DATA; as demais são colunas do próprio extrato.
+# Int64 (inteiro com nulos) evita que uma DATA nula transforme ANO/MES em float nas tabelas de resumo.
+DIMENSOES_DE_DATA = {
+    "ANO": lambda data: data.dt.year.astype("Int64"),
+    "MES": lambda data: data.dt.month.astype("Int64"),
+}
+
+
+def calcular_resumo(df: pd.DataFrame, dimensoes: List[str], medida: str = "VALOR") -> pd.DataFrame:
+    """
+    Agrega o extrato em memória (group-by vetorizado) nas dimensões informadas,
+    retornando a soma da medida e a quantidade de lançamentos de cada grupo.
+    """
+    data = None
+    chaves = []
+    for dimensao in dimensoes:
+        if dimensao in DIMENSOES_DE_DATA:
+            if data is None:
+                data = pd.to_datetime(df["DATA"])
+            chaves.append(DIMENSOES_DE_DATA[dimensao](data).rename(dimensao))
+        elif dimensao in df.columns:
+            chaves.append(df[dimensao])
+        else:
+            raise ValueError(f"Dimensão '{dimensao}' não existe no extrato.")
+
+    resumo = (
+        df.groupby(chaves, dropna=False, sort=False)[medida]
+        .agg(**{medida: "sum", "QTD_LINHAS": "size"})
+        .reset_index()
+    )
+    logger.info(f"📊 Resumo por {dimensoes}: {len(df)} linhas agregadas em {len(resumo)} grupos.")
+    return resumo
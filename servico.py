@@ -0,0 +1,156 @@
+# servico.py
+# Modo serviço: mantém o processo residente (CLR/ADOMD, módulos e SQL das consultas carregados
+# uma única vez, engines e pools de conexão aquecidos) e executa as consultas de AGENDAMENTOS
+# conforme expressões no estilo cron. Uso: python servico.py
+# Os dados de referência (plano de contas e centros de custo, de CCONTA/GCCUSTO) continuam sendo
+# resolvidos pelo servidor a cada execução: PLANO_CONTAS e CENTRO_CUSTO são CTEs unidas no próprio
+# SQL da consulta, e mantê-las em cache aqui exigiria fazer esses joins no pandas. Fica fora do escopo.
+import logging
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+
+from consultas_definidas import consultas
+from funcoes_globais import manter_conexoes_ativas
+
+logger = logging.getLogger("logger_financa")
+
+# Expressões cron de 5 campos: minuto hora dia-do-mês mês dia-da-semana (0 = domingo).
+AGENDAMENTOS: List[Dict[str, str]] = [
+    {"consulta": "FatoFechamento", "cron": "0 2 * * *"},
+]
+
+# Execuções simultâneas de consultas diferentes; a mesma consulta nunca roda em paralelo.
+MAX_EXECUCOES_SIMULTANEAS = 1
+
+_LIMITES_CRON = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _interpretar_campo(campo: str, minimo: int, maximo: int) -> Set[int]:
+    valores = set()
+    for parte in campo.split(","):
+        passo = 1
+        if "/" in parte:
+            parte, passo_str = parte.split("/")
+            passo = int(passo_str)
+        if parte == "*":
+            inicio, fim = minimo, maximo
+        elif "-" in parte:
+            inicio, fim = (int(v) for v in parte.split("-"))
+        else:
+            inicio = int(parte)
+            fim = maximo if passo > 1 else inicio
+        if not (minimo <= inicio <= fim <= maximo):
+            raise ValueError(f"Campo cron '{campo}' fora do intervalo {minimo}-{maximo}.")
+        valores.update(range(inicio, fim + 1, passo))
+    return valores
+
+
+class ExpressaoCron:
+    """Expressão cron de 5 campos (suporta *, listas, intervalos e passos)."""
+
+    def __init__(self, expressao: str):
+        campos = expressao.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expressão cron '{expressao}' deve ter 5 campos.")
+        self.expressao = expressao
+        self.minutos, self.horas, self.dias, self.meses, dias_semana = (
+            _interpretar_campo(campo, minimo, maximo) for campo, (minimo, maximo) in zip(campos, _LIMITES_CRON)
+        )
+        # 7 também representa domingo.
+        self.dias_semana = {d % 7 for d in dias_semana}
+        self._dia_livre = campos[2] == "*"
+        self._semana_livre = campos[4] == "*"
+
+    def corresponde(self, momento: datetime) -> bool:
+        if momento.minute not in self.minutos or momento.hour not in self.horas or momento.month not in self.meses:
+            return False
+        dia_ok = momento.day in self.dias
+        semana_ok = (momento.weekday() + 1) % 7 in self.dias_semana
+        # Como no cron: se ambos os campos forem restritos, basta um deles coincidir.
+        if self._dia_livre or self._semana_livre:
+            return dia_ok and semana_ok
+        return dia_ok or semana_ok
+
+
+class Servico:
+    """Agendador residente com proteção contra sobreposição e desligamento gracioso."""
+
+    def __init__(self, agendamentos: List[Dict[str, str]] = AGENDAMENTOS,
+                 max_execucoes: int = MAX_EXECUCOES_SIMULTANEAS,
+                 executar_consulta: Optional[Callable[[str], str]] = None):
+        if executar_consulta is None:
+            # Importar main configura o logging e carrega a DLL do ADOMD uma única vez.
+            from main import main as executar_consulta
+        self.executar_consulta = executar_consulta
+        for agendamento in agendamentos:
+            if agendamento["consulta"] not in consultas:
+                raise ValueError(f"Consulta '{agendamento['consulta']}' não encontrada nas definições.")
+        self.agendamentos = [(a["consulta"], ExpressaoCron(a["cron"])) for a in agendamentos]
+        self.parada = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_execucoes, thread_name_prefix="execucao")
+        self._em_andamento: Set[str] = set()
+        self._lock = threading.Lock()
+        self._ultimo_minuto: Optional[datetime] = None
+
+    def _executar(self, consulta: str):
+        try:
+            status = self.executar_consulta(consulta)
+            logger.info(f"🗓️ Execução agendada de '{consulta}' finalizada: {status}.")
+        except Exception:
+            logger.error(f"❌ Execução agendada de '{consulta}' falhou.", exc_info=True)
+        finally:
+            with self._lock:
+                self._em_andamento.discard(consulta)
+
+    def disparar(self, consulta: str) -> bool:
+        """Agenda a consulta para execução, a menos que ela já esteja na fila ou rodando."""
+        with self._lock:
+            if consulta in self._em_andamento:
+                logger.warning(f"⚠️ '{consulta}' ainda está em execução; disparo ignorado para evitar sobreposição.")
+                return False
+            self._em_andamento.add(consulta)
+        self._executor.submit(self._executar, consulta)
+        return True
+
+    def verificar_agendamentos(self, agora: datetime) -> List[str]:
+        """
+        Dispara as consultas cujo agendamento corresponde ao minuto de `agora` e retorna as disparadas.
+        O mesmo minuto nunca é tratado duas vezes: a espera usa relógio monotônico e pode acordar
+        ainda dentro do minuto já tratado pelo relógio do sistema.
+        """
+        minuto = agora.replace(second=0, microsecond=0)
+        if minuto == self._ultimo_minuto:
+            return []
+        self._ultimo_minuto = minuto
+        return [consulta for consulta, expressao in self.agendamentos
+                if expressao.corresponde(minuto) and self.disparar(consulta)]
+
+    def executar(self):
+        """Laço principal: verifica os agendamentos a cada minuto até receber o sinal de parada."""
+        manter_conexoes_ativas(True)
+        logger.info(f"🟢 Serviço iniciado com {len(self.agendamentos)} agendamento(s): "
+                    + ", ".join(f"{c} [{e.expressao}]" for c, e in self.agendamentos))
+        try:
+            while not self.parada.is_set():
+                agora = datetime.now().replace(second=0, microsecond=0)
+                self.verificar_agendamentos(agora)
+                proximo_minuto = agora + timedelta(minutes=1)
+                self.parada.wait(max(0.0, (proximo_minuto - datetime.now()).total_seconds()))
+        finally:
+            logger.info("🛑 Encerrando serviço: aguardando execuções em andamento...")
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            manter_conexoes_ativas(False)
+            logger.info("🛑 Serviço encerrado.")
+
+    def parar(self, *_):
+        self.parada.set()
+
+
+if __name__ == "__main__":
+    servico = Servico()
+    signal.signal(signal.SIGINT, servico.parar)
+    signal.signal(signal.SIGTERM, servico.parar)
+    servico.executar()
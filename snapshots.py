@@ -0,0 +1,189 @@
+# snapshots.py
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("logger_financa")
+
+PASTA_SNAPSHOTS = "snapshots"
+
+# Partição usada para linhas sem DATA.
+PARTICAO_SEM_DATA = "sem_data"
+
+
+def _pasta(consulta: str, pasta: str) -> str:
+    return os.path.join(pasta, consulta)
+
+
+def _caminho_objeto(consulta: str, pasta: str, hash_particao: str) -> str:
+    return os.path.join(_pasta(consulta, pasta), "objetos", f"{hash_particao}.parquet")
+
+
+def _caminho_versao(consulta: str, pasta: str, versao: int) -> str:
+    return os.path.join(_pasta(consulta, pasta), "versoes", f"{versao:06d}.json")
+
+
+def _particionar(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Divide o extrato por ano-mês da coluna DATA."""
+    periodos = pd.to_datetime(df["DATA"]).dt.strftime("%Y-%m").fillna(PARTICAO_SEM_DATA)
+    return {periodo: particao for periodo, particao in df.groupby(periodos, sort=True)}
+
+
+def _normalizar_tipos(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Uniformiza os tipos inferidos na leitura, que variam entre execuções com o mesmo conteúdo:
+    um NULL numa coluna inteira (ex.: IDRATEIO, IDMOV) a transforma em float, e uma coluna
+    só com NULLs vem como object ou float. Inteiros passam a Int64 e colunas vazias a object.
+    """
+    normalizado = {}
+    for coluna, serie in df.items():
+        if serie.isna().all():
+            serie = pd.Series([None] * len(serie), index=serie.index, dtype=object)
+        elif pd.api.types.is_bool_dtype(serie):
+            pass
+        elif pd.api.types.is_integer_dtype(serie):
+            serie = serie.astype("Int64")
+        elif pd.api.types.is_float_dtype(serie):
+            valores = serie.dropna()
+            if (valores % 1 == 0).all() and valores.abs().max() < 2 ** 63:
+                serie = serie.astype("Int64")
+        normalizado[coluna] = serie
+    return pd.DataFrame(normalizado, index=df.index)
+
+
+def _hash_particao(particao: pd.DataFrame) -> str:
+    """
+    Hash do conteúdo da partição, independente da ordem das linhas (a consulta não tem ORDER BY)
+    e dos tipos inferidos na leitura. Inclui nomes e tipos normalizados das colunas para que
+    mudanças de esquema gerem uma nova versão da partição.
+    """
+    particao = _normalizar_tipos(particao)
+    hashes_linhas = np.sort(pd.util.hash_pandas_object(particao, index=False).to_numpy())
+    digest = hashlib.sha256(hashes_linhas.tobytes())
+    digest.update(repr([(coluna, str(tipo)) for coluna, tipo in particao.dtypes.items()]).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def listar_versoes(consulta: str, pasta: str = PASTA_SNAPSHOTS) -> List[int]:
+    pasta_versoes = os.path.join(_pasta(consulta, pasta), "versoes")
+    if not os.path.isdir(pasta_versoes):
+        return []
+    return sorted(int(nome[:-5]) for nome in os.listdir(pasta_versoes) if nome.endswith(".json"))
+
+
+def ler_manifesto(consulta: str, versao: Optional[int] = None, pasta: str = PASTA_SNAPSHOTS) -> Dict:
+    """Manifesto da versão (a mais recente se `versao` for None)."""
+    versoes = listar_versoes(consulta, pasta)
+    if not versoes:
+        raise FileNotFoundError(f"Nenhum snapshot encontrado para '{consulta}'.")
+    versao = versoes[-1] if versao is None else versao
+    with open(_caminho_versao(consulta, pasta, versao), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def salvar_snapshot(df: pd.DataFrame, consulta: str, pasta: str = PASTA_SNAPSHOTS) -> int:
+    """
+    Grava o extrato como uma nova versão. Cada partição (ano-mês) é um arquivo Parquet compactado
+    endereçado pelo hash do conteúdo: partições iguais às de versões anteriores são apenas
+    referenciadas pelo manifesto, e só as alteradas são escritas. Retorna o número da versão.
+    """
+    os.makedirs(os.path.join(_pasta(consulta, pasta), "objetos"), exist_ok=True)
+    os.makedirs(os.path.join(_pasta(consulta, pasta), "versoes"), exist_ok=True)
+
+    particoes = {}
+    reaproveitadas = 0
+    for periodo, particao in _particionar(df).items():
+        hash_particao = _hash_particao(particao)
+        caminho = _caminho_objeto(consulta, pasta, hash_particao)
+        if os.path.exists(caminho):
+            reaproveitadas += 1
+        else:
+            temporario = f"{caminho}.tmp"
+            particao.to_parquet(temporario, index=False, compression="zstd")
+            os.replace(temporario, caminho)
+        particoes[periodo] = {"hash": hash_particao, "linhas": len(particao)}
+
+    versoes = listar_versoes(consulta, pasta)
+    versao = versoes[-1] + 1 if versoes else 1
+    manifesto = {
+        "versao": versao,
+        "criado_em": datetime.now().isoformat(timespec="seconds"),
+        "linhas": len(df),
+        "colunas": list(df.columns),
+        "particoes": particoes,
+    }
+    caminho_versao = _caminho_versao(consulta, pasta, versao)
+    with open(f"{caminho_versao}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(f"{caminho_versao}.tmp", caminho_versao)
+
+    logger.info(
+        f"🗂️ Snapshot v{versao} de '{consulta}': {len(particoes)} partições, "
+        f"{len(particoes) - reaproveitadas} gravadas e {reaproveitadas} reaproveitadas."
+    )
+    return versao
+
+
+def carregar_versao(
+    consulta: str, versao: Optional[int] = None, periodos: Optional[List[str]] = None,
+    pasta: str = PASTA_SNAPSHOTS
+) -> pd.DataFrame:
+    """Lê uma versão anterior (a mais recente se `versao` for None), opcionalmente só alguns períodos 'AAAA-MM'."""
+    manifesto = ler_manifesto(consulta, versao, pasta)
+    selecionadas = {
+        periodo: info for periodo, info in manifesto["particoes"].items()
+        if periodos is None or periodo in periodos
+    }
+    if not selecionadas:
+        return pd.DataFrame(columns=manifesto["colunas"])
+    return pd.concat(
+        [pd.read_parquet(_caminho_objeto(consulta, pasta, info["hash"])) for info in selecionadas.values()],
+        ignore_index=True,
+    )
+
+
+def diferenca_versoes(
+    consulta: str, versao_antiga: int, versao_nova: int, pasta: str = PASTA_SNAPSHOTS
+) -> pd.DataFrame:
+    """
+    Linhas incluídas e removidas entre duas versões. Só as partições cujo hash mudou são lidas;
+    a coluna ALTERACAO indica 'incluida' ou 'removida'. Linhas repetidas são comparadas pela
+    quantidade de ocorrências, então incluir ou remover uma cópia também aparece na diferença.
+    """
+    antigas = ler_manifesto(consulta, versao_antiga, pasta)["particoes"]
+    novas = ler_manifesto(consulta, versao_nova, pasta)["particoes"]
+    alterados = sorted(
+        periodo for periodo in set(antigas) | set(novas)
+        if antigas.get(periodo, {}).get("hash") != novas.get(periodo, {}).get("hash")
+    )
+    logger.info(f"🗂️ '{consulta}' v{versao_antiga} → v{versao_nova}: períodos alterados {alterados}")
+    if not alterados:
+        return pd.DataFrame(columns=ler_manifesto(consulta, versao_nova, pasta)["colunas"] + ["ALTERACAO"])
+
+    df_antigo = carregar_versao(consulta, versao_antiga, alterados, pasta)
+    df_novo = carregar_versao(consulta, versao_nova, alterados, pasta)
+    colunas = [c for c in df_novo.columns if c in df_antigo.columns]
+    df_antigo = _normalizar_tipos(df_antigo[colunas])
+    df_novo = _normalizar_tipos(df_novo[colunas])
+    # Colunas que ainda divergem no tipo (ex.: só NULLs de um lado) são comparadas como objeto.
+    divergentes = [c for c in colunas if df_antigo[c].dtype != df_novo[c].dtype]
+    if divergentes:
+        df_antigo = df_antigo.astype({c: object for c in divergentes})
+        df_novo = df_novo.astype({c: object for c in divergentes})
+
+    def _com_ocorrencia(df: pd.DataFrame) -> pd.DataFrame:
+        # Numera as cópias de cada linha para que o merge compare contagens, não conjuntos.
+        return df.assign(_OCORRENCIA=df.groupby(colunas, dropna=False, sort=False).cumcount())
+
+    comparacao = _com_ocorrencia(df_antigo).merge(
+        _com_ocorrencia(df_novo), on=colunas + ["_OCORRENCIA"], how="outer", indicator=True
+    )
+    comparacao = comparacao[comparacao["_merge"] != "both"].drop(columns="_OCORRENCIA")
+    comparacao["ALTERACAO"] = comparacao.pop("_merge").map({"left_only": "removida", "right_only": "incluida"})
+    return comparacao.reset_index(drop=True)
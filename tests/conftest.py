@@ -0,0 +1,9 @@
+# conftest.py
+import os
+import sys
+
+# Os módulos do projeto ficam na raiz do repositório e leem arquivos (ex.: FatoFechamento.sql)
+# a partir do diretório atual.
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.chdir(RAIZ)
@@ -0,0 +1,112 @@
+# test_notificacoes.py
+import gzip
+import logging
+import socket
+import threading
+from email import message_from_bytes, policy
+
+import pytest
+
+from notificacoes import ColetorErros, NotificadorArquivo, NotificadorSMTP, ResumoExecucao, compactar_log
+
+
+class ServidorSMTP:
+    """Servidor SMTP mínimo numa porta livre: aceita as mensagens e guarda o conteúdo recebido."""
+
+    def __init__(self):
+        self.mensagens = []
+        self._socket = socket.create_server(("127.0.0.1", 0))
+        self.porta = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._atender, daemon=True)
+        self._thread.start()
+
+    def _atender(self):
+        conexao, _ = self._socket.accept()
+        with conexao, conexao.makefile("rb") as entrada:
+            conexao.sendall(b"220 teste\r\n")
+            for linha in entrada:
+                comando = linha.strip().upper()
+                if comando.startswith((b"EHLO", b"HELO")):
+                    conexao.sendall(b"250 teste\r\n")
+                elif comando == b"DATA":
+                    conexao.sendall(b"354 fim com <CRLF>.<CRLF>\r\n")
+                    corpo = []
+                    for dado in entrada:
+                        if dado == b".\r\n":
+                            break
+                        corpo.append(dado[1:] if dado.startswith(b"..") else dado)
+                    self.mensagens.append(b"".join(corpo))
+                    conexao.sendall(b"250 ok\r\n")
+                elif comando == b"QUIT":
+                    conexao.sendall(b"221 tchau\r\n")
+                    return
+                else:
+                    conexao.sendall(b"250 ok\r\n")
+
+    def fechar(self):
+        self._thread.join(5)
+        self._socket.close()
+
+
+@pytest.fixture
+def log_execucao(tmp_path):
+    """Log do dia com uma execução anterior seguida da execução atual; devolve (caminho, inicio)."""
+    caminho = tmp_path / "execucao_2026-10-19.log"
+    anterior = "execução anterior\n" * 100
+    caminho.write_text(anterior + "execução atual\n", encoding="utf-8")
+    return str(caminho), len(anterior.encode("utf-8"))
+
+
+def test_compactar_log_leva_apenas_o_trecho_da_execucao(log_execucao, tmp_path):
+    caminho, inicio = log_execucao
+    destino = compactar_log(caminho, str(tmp_path / "trecho.log.gz"), inicio)
+    with gzip.open(destino, "rt", encoding="utf-8") as f:
+        assert f.read() == "execução atual\n"
+    assert compactar_log(str(tmp_path / "inexistente.log"), str(tmp_path / "x.gz")) is None
+
+
+def test_coletor_erros_guarda_so_os_ultimos():
+    coletor = ColetorErros(max_erros=3)
+    logger = logging.getLogger("teste_coletor")
+    logger.addHandler(coletor)
+    try:
+        for i in range(10):
+            logger.error(f"erro {i}")
+        logger.warning("aviso não é erro")
+    finally:
+        logger.removeHandler(coletor)
+    assert coletor.total == 10
+    assert [erro.split(" - ", 1)[1] for erro in coletor.erros] == ["erro 7", "erro 8", "erro 9"]
+
+
+def test_notificador_smtp_envia_resumo_com_o_trecho_do_log(log_execucao):
+    caminho, inicio = log_execucao
+    servidor = ServidorSMTP()
+    resumo = ResumoExecucao("FatoFechamento", "SUCESSO", metricas={"Linhas extraídas": 42},
+                            erros=["02:00:01 - falhou"], total_erros=1, caminho_log=caminho, inicio_log=inicio)
+    try:
+        NotificadorSMTP("127.0.0.1", servidor.porta, remetente="a@teste", destinatario="b@teste", timeout=5).enviar(resumo)
+    finally:
+        servidor.fechar()
+
+    assert len(servidor.mensagens) == 1
+    mensagem = message_from_bytes(servidor.mensagens[0], policy=policy.default)
+    assert mensagem["Subject"] == resumo.assunto
+    assert "Linhas extraídas: 42" in mensagem.get_body().get_content()
+    anexo, = mensagem.iter_attachments()
+    assert anexo.get_filename() == resumo.nome_anexo
+    assert gzip.decompress(anexo.get_content()).decode("utf-8") == "execução atual\n"
+
+
+def test_notificador_arquivo_nao_sobrescreve_o_anexo(log_execucao, tmp_path):
+    caminho, inicio = log_execucao
+    pasta = tmp_path / "notificacoes"
+    notificador = NotificadorArquivo(str(pasta))
+    resumos = [ResumoExecucao("FatoFechamento", "SUCESSO", caminho_log=caminho, inicio_log=inicio) for _ in range(2)]
+    for resumo in resumos:
+        notificador.enviar(resumo)
+
+    assert len(list(pasta.glob("notificacao_*.txt"))) == 2
+    anexos = sorted(p.name for p in pasta.glob("*.log.gz"))
+    assert anexos == sorted(resumo.nome_anexo for resumo in resumos)
+    assert not (tmp_path / "execucao_2026-10-19.log.gz").exists()
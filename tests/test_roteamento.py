@@ -0,0 +1,93 @@
+# test_roteamento.py
+import logging
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+import funcoes_globais as fg
+from conexoes import CONEXOES
+
+
+@pytest.fixture
+def endpoints(tmp_path, monkeypatch):
+    """Conexão 'TESTE' com um primário e uma réplica de leitura em SQLite; devolve as duas URLs."""
+    primario = f"sqlite:///{tmp_path / 'primario.db'}"
+    replica = f"sqlite:///{tmp_path / 'replica.db'}"
+    monkeypatch.setitem(CONEXOES, "TESTE", {"tipo": "sql", "endpoints": [
+        {"papel": "primario", "url": primario},
+        {"papel": "leitura", "url": replica},
+    ]})
+    monkeypatch.setattr(fg, "_saude_endpoints", {})
+    monkeypatch.setattr(fg, "_engines_compartilhadas", {})
+    yield primario, replica
+    fg.encerrar_conexoes()
+
+
+def _url(engine_instance) -> str:
+    return engine_instance.url.render_as_string(hide_password=False)
+
+
+def _conectar(finalidade: str):
+    return fg.funcao_conexao("TESTE", tentativas=1, delay_segundos=0, finalidade=finalidade)
+
+
+def _indisponivel(url: str, tmp_path):
+    """Faz o endpoint `url` apontar para um arquivo que o SQLite não consegue abrir."""
+    CONEXOES["TESTE"]["endpoints"] = [
+        {**e, "url": f"sqlite:///{tmp_path / 'nao_existe' / 'x.db'}"} if e["url"] == url else e
+        for e in CONEXOES["TESTE"]["endpoints"]
+    ]
+
+
+def test_leitura_vai_para_a_replica_e_escrita_para_o_primario(endpoints):
+    primario, replica = endpoints
+    assert _url(_conectar("leitura")) == replica
+    assert _url(_conectar("escrita")) == primario
+
+
+def test_replica_em_cooldown_cede_a_leitura_ao_primario(endpoints):
+    primario, replica = endpoints
+    fg._saude_endpoints[replica] = {"falhou_em": time.monotonic()}
+    assert _url(_conectar("leitura")) == primario
+
+
+def test_replica_indisponivel_cai_para_o_primario_sem_log_de_erro(endpoints, tmp_path, caplog):
+    primario, _ = endpoints
+    _indisponivel(CONEXOES["TESTE"]["endpoints"][1]["url"], tmp_path)
+    with caplog.at_level(logging.INFO, logger="logger_financa"):
+        assert _url(_conectar("leitura")) == primario
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+    assert any(r.levelno == logging.WARNING for r in caplog.records)
+
+    # A réplica que falhou entra em cooldown: a próxima leitura já começa pelo primário.
+    replica_quebrada = CONEXOES["TESTE"]["endpoints"][1]["url"]
+    assert "falhou_em" in fg._saude_endpoints[replica_quebrada]
+
+
+def test_erro_apenas_quando_todos_os_endpoints_falham(endpoints, tmp_path, caplog):
+    primario, replica = endpoints
+    _indisponivel(primario, tmp_path)
+    _indisponivel(replica, tmp_path)
+    with caplog.at_level(logging.INFO, logger="logger_financa"), pytest.raises(Exception):
+        _conectar("leitura")
+    erros = [r for r in caplog.records if r.levelno >= logging.ERROR]
+    assert len(erros) == 1
+    assert erros[0].exc_info
+
+
+def test_engine_compartilhada_que_falha_e_descartada(endpoints, tmp_path, monkeypatch):
+    primario, replica = endpoints
+    monkeypatch.setattr(fg, "_manter_conexoes_ativas", True)
+    assert _url(_conectar("leitura")) == replica
+    assert replica in fg._engines_compartilhadas
+
+    # A engine guardada para a réplica deixa de conectar (ex.: réplica fora do ar).
+    quebrada = create_engine(f"sqlite:///{tmp_path / 'sumiu' / 'replica.db'}")
+    fg._engines_compartilhadas[replica] = quebrada
+
+    assert _url(_conectar("leitura")) == primario
+    assert fg._engines_compartilhadas.get(replica) is not quebrada
+    assert _url(fg._engines_compartilhadas[primario]) == primario
@@ -0,0 +1,132 @@
+# test_salvar_no_financa.py
+import sqlite3
+
+import pandas as pd
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+import funcoes_globais as fg
+from conexoes import CONEXOES
+
+
+class ErroDriver(Exception):
+    """Imita um erro do pyodbc: o SQLSTATE vem em args[0]."""
+
+
+def _erro(sqlstate: str, mensagem: str) -> ErroDriver:
+    return ErroDriver(sqlstate, f"[{sqlstate}] [Microsoft][ODBC Driver 18 for SQL Server]{mensagem} (0) (SQLExecute)")
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Conexão 'TESTE' apontando para um SQLite local; devolve o caminho do arquivo."""
+    caminho = tmp_path / "financa.db"
+    monkeypatch.setitem(CONEXOES, "TESTE", {
+        "tipo": "sql", "endpoints": [{"papel": "primario", "url": f"sqlite:///{caminho}"}]
+    })
+    monkeypatch.setattr(fg, "TAMANHO_BLOCO", 1000)
+    monkeypatch.setattr(fg.time, "sleep", lambda _: None)
+    monkeypatch.chdir(tmp_path)
+    return caminho
+
+
+@pytest.fixture
+def falhas():
+    """
+    Regras de falha aplicadas a cada INSERT: funções (sql, linhas) -> exceção ou None.
+    Os INSERTs com várias linhas chegam como executemany (lista de tuplas).
+    """
+    regras = []
+
+    def antes_de_executar(conn, cursor, sql, parametros, contexto, executemany):
+        if not sql.lstrip().upper().startswith("INSERT"):
+            return
+        linhas = parametros if executemany else [parametros]
+        for regra in regras:
+            erro = regra(sql, linhas)
+            if erro:
+                raise erro
+
+    event.listen(Engine, "before_cursor_execute", antes_de_executar)
+    yield regras
+    event.remove(Engine, "before_cursor_execute", antes_de_executar)
+
+
+def _linhas_invalidas(*valores):
+    """Regra: qualquer INSERT que contenha um dos VALORes falha com truncamento (22001)."""
+    def regra(sql, linhas):
+        if "_quarentena" not in sql and any(linha[0] in valores for linha in linhas):
+            return _erro("22001", "String data, right truncation")
+    return regra
+
+
+def _extrato(linhas: int = 2500) -> pd.DataFrame:
+    return pd.DataFrame({"VALOR": [float(i) for i in range(linhas)], "CONTA": "1.01"})
+
+
+def _contar(caminho, tabela: str) -> int:
+    with sqlite3.connect(caminho) as conexao:
+        return conexao.execute(f'SELECT COUNT(*) FROM "{tabela}"').fetchone()[0]
+
+
+def test_uma_linha_invalida_vai_para_a_quarentena(banco, falhas):
+    falhas.append(_linhas_invalidas(100.0))
+
+    resultado = fg.salvar_no_financa(_extrato(), "T", conexao="TESTE")
+
+    assert resultado == {"linhas_salvas": 2499, "linhas_quarentena": 1}
+    assert _contar(banco, "T") == 2499
+    with sqlite3.connect(banco) as conexao:
+        bloco, linha, erro = conexao.execute('SELECT BLOCO, LINHA, ERRO FROM "T_quarentena"').fetchone()
+    assert (bloco, linha) == ("1", 100)
+    assert "22001" in erro
+
+
+def test_linhas_invalidas_em_metades_diferentes_do_bloco(banco, falhas):
+    # O mesmo erro nas duas metades do bloco não deve ser tratado como falha sistêmica.
+    falhas.append(_linhas_invalidas(100.0, 900.0))
+
+    resultado = fg.salvar_no_financa(_extrato(), "T", conexao="TESTE")
+
+    assert resultado == {"linhas_salvas": 2498, "linhas_quarentena": 2}
+    assert _contar(banco, "T") == 2498
+
+
+def test_falha_transitoria_e_retentada_sem_quarentena(banco, falhas):
+    tentativas = []
+
+    def deadlock_no_primeiro_insert(sql, linhas):
+        if not tentativas:
+            tentativas.append(sql)
+            return _erro("40001", "Transaction was deadlocked on lock resources (1205)")
+
+    falhas.append(deadlock_no_primeiro_insert)
+
+    resultado = fg.salvar_no_financa(_extrato(), "T", conexao="TESTE")
+
+    assert resultado == {"linhas_salvas": 2500, "linhas_quarentena": 0}
+    assert _contar(banco, "T") == 2500
+
+
+def test_falha_em_todas_as_linhas_e_sistemica(banco, falhas, monkeypatch):
+    monkeypatch.setattr(fg, "LIMITE_LINHAS_QUARENTENA", 10)
+    falhas.append(lambda sql, linhas: _erro("22018", "Conversion failed") if "_quarentena" not in sql else None)
+
+    with pytest.raises(fg.FalhaSistemica):
+        fg.salvar_no_financa(_extrato(), "T", conexao="TESTE")
+
+
+def test_quarentena_em_csv_quando_a_tabela_falha(banco, falhas):
+    falhas.append(_linhas_invalidas(7.0))
+    falhas.append(lambda sql, linhas: _erro("42000", "Permission denied") if "_quarentena" in sql else None)
+
+    resultado = fg.salvar_no_financa(_extrato(), "T", conexao="TESTE")
+
+    assert resultado["linhas_quarentena"] == 1
+    arquivos = list((banco.parent / "logs" / "quarentena").glob("T_quarentena_*.csv"))
+    assert len(arquivos) == 1
+    quarentena = pd.read_csv(arquivos[0], sep=";", encoding="utf-8-sig")
+    assert quarentena["LINHA"].tolist() == [7]
@@ -0,0 +1,99 @@
+# test_servico.py
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+from servico import ExpressaoCron, Servico
+
+
+def test_cron_passos_intervalos_e_listas():
+    expressao = ExpressaoCron("*/15 8-10 * * *")
+    assert expressao.minutos == {0, 15, 30, 45}
+    assert expressao.horas == {8, 9, 10}
+
+    expressao = ExpressaoCron("5-20/5 0,12 1 1-3 *")
+    assert expressao.minutos == {5, 10, 15, 20}
+    assert expressao.horas == {0, 12}
+    assert expressao.meses == {1, 2, 3}
+
+    # Um valor único com passo vai até o fim do intervalo, como no cron.
+    assert ExpressaoCron("10/20 * * * *").minutos == {10, 30, 50}
+
+
+def test_cron_domingo_como_0_ou_7():
+    assert ExpressaoCron("0 0 * * 7").dias_semana == {0}
+    # 2026-10-18 é um domingo.
+    assert ExpressaoCron("0 0 * * 7").corresponde(datetime(2026, 10, 18))
+    assert not ExpressaoCron("0 0 * * 0").corresponde(datetime(2026, 10, 19))
+
+
+@pytest.mark.parametrize("expressao", ["* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "10-5 * * * *"])
+def test_cron_invalida(expressao):
+    with pytest.raises(ValueError):
+        ExpressaoCron(expressao)
+
+
+def test_cron_dia_do_mes_ou_dia_da_semana():
+    # Ambos restritos: basta um coincidir (dia 1 OU segunda-feira).
+    expressao = ExpressaoCron("0 2 1 * 1")
+    assert expressao.corresponde(datetime(2026, 10, 1, 2, 0))   # quinta, dia 1
+    assert expressao.corresponde(datetime(2026, 10, 19, 2, 0))  # segunda
+    assert not expressao.corresponde(datetime(2026, 10, 20, 2, 0))
+    assert not expressao.corresponde(datetime(2026, 10, 19, 2, 1))
+
+    # Só um deles restrito: vale apenas esse.
+    assert not ExpressaoCron("0 2 1 * *").corresponde(datetime(2026, 10, 19, 2, 0))
+    assert ExpressaoCron("0 2 * * 1").corresponde(datetime(2026, 10, 19, 2, 0))
+    assert not ExpressaoCron("0 2 * * 1").corresponde(datetime(2026, 10, 1, 2, 0))
+
+
+class ExecucaoBloqueada:
+    """Substitui main(): cada chamada fica presa até `liberar` ser sinalizado."""
+
+    def __init__(self):
+        self.chamadas = []
+        self.iniciou = threading.Event()
+        self.liberar = threading.Event()
+
+    def __call__(self, consulta: str) -> str:
+        self.chamadas.append(consulta)
+        self.iniciou.set()
+        self.liberar.wait(5)
+        return "SUCESSO"
+
+
+@pytest.fixture
+def servico():
+    execucao = ExecucaoBloqueada()
+    servico = Servico([{"consulta": "FatoFechamento", "cron": "* * * * *"}], executar_consulta=execucao)
+    yield servico, execucao
+    execucao.liberar.set()
+    servico._executor.shutdown(wait=True)
+
+
+def test_disparar_rejeita_sobreposicao(servico):
+    servico, execucao = servico
+    assert servico.disparar("FatoFechamento")
+    assert execucao.iniciou.wait(5)
+    assert not servico.disparar("FatoFechamento")
+
+    execucao.liberar.set()
+    servico._executor.shutdown(wait=True)
+    assert execucao.chamadas == ["FatoFechamento"]
+    assert servico._em_andamento == set()
+
+
+def test_mesmo_minuto_nao_dispara_duas_vezes(servico):
+    servico, execucao = servico
+    execucao.liberar.set()
+    assert servico.verificar_agendamentos(datetime(2026, 10, 19, 2, 0, 0)) == ["FatoFechamento"]
+    # Acordou antes da virada do minuto: nada é disparado de novo.
+    assert servico.verificar_agendamentos(datetime(2026, 10, 19, 2, 0, 59, 900000)) == []
+    limite = time.monotonic() + 5
+    while servico._em_andamento and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert servico.verificar_agendamentos(datetime(2026, 10, 19, 2, 1, 0)) == ["FatoFechamento"]
@@ -1,3 +1,77 @@
+import re
+from typing import List, Tuple
+
+
 def carregar_sql(caminho: str) -> str:
     with open(caminho, encoding="utf-8") as f:
-        return f.read()
\ No newline at end of file
+        return f.read()
+
+
+def _palavras_nivel_zero(sql: str) -> List[Tuple[int, str]]:
+    """
+    Retorna (posição, palavra em maiúsculas) das palavras-chave fora de parênteses,
+    ignorando comentários, strings e identificadores entre colchetes.
+    """
+    palavras = []
+    nivel = 0
+    i = 0
+    tamanho = len(sql)
+    while i < tamanho:
+        c = sql[i]
+        if sql.startswith("--", i):
+            fim = sql.find("\n", i)
+            i = tamanho if fim == -1 else fim + 1
+        elif sql.startswith("/*", i):
+            fim = sql.find("*/", i + 2)
+            i = tamanho if fim == -1 else fim + 2
+        elif c == "'":
+            i += 1
+            while i < tamanho:
+                if sql[i] == "'" and sql.startswith("''", i):
+                    i += 2
+                elif sql[i] == "'":
+                    i += 1
+                    break
+                else:
+                    i += 1
+        elif c == "[":
+            fim = sql.find("]", i)
+            i = tamanho if fim == -1 else fim + 1
+        elif c == "(":
+            nivel += 1
+            i += 1
+        elif c == ")":
+            nivel -= 1
+            i += 1
+        elif c.isalpha() or c == "_":
+            m = re.match(r"\w+", sql[i:])
+            if nivel == 0:
+                palavras.append((i, m.group(0).upper()))
+            i += len(m.group(0))
+        else:
+            i += 1
+    return palavras
+
+
+def envolver_consulta(sql: str, consulta_externa: str) -> str:
+    """
+    Expõe o SELECT final de `sql` como a CTE `__fonte` e acrescenta `consulta_externa`
+    (que deve ler de `__fonte`). Funciona também para consultas que já começam com WITH,
+    onde um `SELECT ... FROM (sql)` não seria válido no SQL Server.
+    Um ORDER BY final é descartado, pois não é permitido dentro de uma CTE.
+    """
+    sql = sql.strip().rstrip(";")
+    palavras = _palavras_nivel_zero(sql)
+    selects = [pos for pos, palavra in palavras if palavra == "SELECT"]
+    if not selects:
+        raise ValueError("A consulta não contém um SELECT de nível superior.")
+    # Os corpos das CTEs ficam entre parênteses; o primeiro SELECT de nível zero inicia a consulta final.
+    inicio_final = selects[0]
+
+    ordens = [pos for pos, palavra in palavras if palavra == "ORDER" and pos > inicio_final]
+    select_final = sql[inicio_final:ordens[-1]] if ordens else sql[inicio_final:]
+
+    if palavras and palavras[0][1] == "WITH":
+        prefixo = sql[:inicio_final].rstrip()
+        return f"{prefixo},\n__fonte AS (\n{select_final}\n)\n{consulta_externa}"
+    return f"WITH __fonte AS (\n{select_final}\n)\n{consulta_externa}"